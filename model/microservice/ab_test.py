@@ -1,130 +1,260 @@
-import pandas as pd
-import os
 import json
 import logging
 import hashlib
+import bisect
+import threading
 from datetime import datetime
-from collections import defaultdict
+from log_sink import LogSink
+from experiment_stats import ExperimentStats, is_feedback
+from assignment_store import AssignmentStore
+from log_store import SQLiteLogStore
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+DEFAULT_ALLOCATION = (('A', 1.0), ('B', 1.0))
+HASH_BUCKETS = 10 ** 6
+
 class ABTestManager:
-    def __init__(self, log_file='ab_log.csv'):
+    def __init__(self, log_file='ab_log.csv', state_file='ab_state.db', **sink_options):
         self.log_file = log_file
-        self.assignments = {}
-        self.interaction_count = defaultdict(int)
+        self.assignments = AssignmentStore(state_file)
+        self.records = []
+        self.stats = ExperimentStats()
+        # Keeps records (and the sink queue) in timestamp order across request threads
+        self._lock = threading.Lock()
+        self.sink = self._open_sink(**sink_options)
         self._load_log()
     
+    def _open_sink(self, **sink_options):
+        return LogSink(self.log_file, **sink_options)
+    
     def _load_log(self):
-        if os.path.exists(self.log_file):
+        # Every segment, rotated ones included, is read into memory: /ab_stats and /ab_log cover
+        # the whole history, so rotation bounds file size but not memory or startup time
+        segments = self.sink.segments()
+        if segments:
+            import pandas as pd
+        
+        for path in segments:
             try:
-                self.log_df = pd.read_csv(self.log_file)
-                logger.info(f"Loaded A/B log: {len(self.log_df)} records")
+                self.records.extend(pd.read_csv(path).to_dict('records'))
             except Exception as e:
-                logger.warning(f"Could not load log: {e}")
-                self.log_df = pd.DataFrame()
-        else:
-            self.log_df = pd.DataFrame()
-    
-    def assign_variant(self, listing_id):
-        if listing_id in self.assignments:
-            return self.assignments[listing_id]
-        
-        listing_hash = int(hashlib.md5(str(listing_id).encode()).hexdigest(), 16)
-        variant = 'A' if listing_hash % 2 == 0 else 'B'
+                logger.warning(f"Could not load log {path}: {e}")
         
-        self.assignments[listing_id] = variant
-        self.interaction_count[variant] += 1
+        # Batches from several worker processes can interleave slightly out of order
+        self.records.sort(key=_timestamp)
+        for record in self.records:
+            self.stats.update(record)
+        logger.info(f"Loaded A/B log: {len(self.records)} records")
+    
+    @property
+    def log_df(self):
+        import pandas as pd
         
+        return pd.DataFrame(self.records)
+    
+    def record_count(self):
+        return len(self.records)
+    
+    def _append(self, records):
+        # Caller holds self._lock
+        self.records.extend(records)
+        for record in records:
+            self.stats.update(record)
+        self.sink.write_many(records)
+    
+    def close(self):
+        self.sink.close()
+        self.assignments.close()
+    
+    def assign_variant(self, listing_id, allocation=None, available=None):
+        # allocation: [(variant, weight)]; only decides for listings seen for the first time.
+        # available: variants that can serve (default: those in the allocation). A listing whose
+        # variant was dropped from variants.json or failed to load is re-assigned.
+        allocation = allocation or DEFAULT_ALLOCATION
+        available = set(available) if available is not None else {v for v, _ in allocation}
+        variant = self.assignments.get_or_assign(listing_id, lambda l: hash_variant(l, allocation))
+        # Nothing loaded at all: keep assignments rather than reshuffling them
+        if available and variant not in available:
+            replacement = hash_variant(listing_id, allocation)
+            if replacement != variant:
+                logger.info(f"Listing {listing_id}: variant {variant} is not served, re-assigned to {replacement}")
+                variant = self.assignments.reassign(listing_id, variant, replacement)
         return variant
     
+    def _interaction_record(self, listing_id, variant, top_aspects, bottom_aspects):
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'listing_id': listing_id,
+            'variant': variant,
+            'top_aspects': json.dumps([a['aspect'] for a in top_aspects]),
+            'bottom_aspects': json.dumps([a['aspect'] for a in bottom_aspects]),
+            'top_scores': json.dumps([a['score'] for a in top_aspects]),
+            'bottom_scores': json.dumps([a['score'] for a in bottom_aspects]),
+        }
+    
     def log_interaction(self, listing_id, variant, top_aspects, bottom_aspects):
         try:
-            interaction = {
-                'timestamp': datetime.now().isoformat(),
-                'listing_id': listing_id,
-                'variant': variant,
-                'top_aspects': json.dumps([a['aspect'] for a in top_aspects]),
-                'bottom_aspects': json.dumps([a['aspect'] for a in bottom_aspects]),
-                'top_scores': json.dumps([a['score'] for a in top_aspects]),
-                'bottom_scores': json.dumps([a['score'] for a in bottom_aspects]),
-            }
-            
-            self.log_df = pd.concat([self.log_df, pd.DataFrame([interaction])], ignore_index=True)
-            self.log_df.to_csv(self.log_file, index=False)
-            
+            with self._lock:
+                interaction = self._interaction_record(listing_id, variant, top_aspects, bottom_aspects)
+                self._append([interaction])
+        
         except Exception as e:
             logger.error(f"Log interaction error: {str(e)}")
     
+    def log_interactions(self, interactions):
+        # interactions: iterable of (listing_id, variant, top_aspects, bottom_aspects)
+        try:
+            with self._lock:
+                records = [self._interaction_record(*i) for i in interactions]
+                self._append(records)
+        
+        except Exception as e:
+            logger.error(f"Log interactions error: {str(e)}")
+    
     def log_feedback(self, listing_id, rating, comment=''):
         try:
-            variant = self.assignments.get(listing_id, 'unknown')
-            
-            feedback = {
-                'timestamp': datetime.now().isoformat(),
-                'listing_id': listing_id,
-                'variant': variant,
-                'rating': rating,
-                'comment': comment,
-                'feedback': True
-            }
-            
-            self.log_df = pd.concat([self.log_df, pd.DataFrame([feedback])], ignore_index=True)
-            self.log_df.to_csv(self.log_file, index=False)
+            variant = self.assignments.get(listing_id) or 'unknown'
             
+            with self._lock:
+                feedback = {
+                    'timestamp': datetime.now().isoformat(),
+                    'listing_id': listing_id,
+                    'variant': variant,
+                    'rating': rating,
+                    'comment': comment,
+                    'feedback': True
+                }
+                
+                self._append([feedback])
+        
         except Exception as e:
             logger.error(f"Log feedback error: {str(e)}")
     
     def get_statistics(self):
         try:
-            if self.log_df.empty:
-                return {
-                    "total_interactions": 0,
-                    "variant_A": {"count": 0},
-                    "variant_B": {"count": 0}
-                }
-            
-            interactions = self.log_df[self.log_df.get('feedback') != True] if 'feedback' in self.log_df.columns else self.log_df
-            
-            stats = {
-                "total_interactions": len(interactions),
-                "variant_A": {
-                    "count": len(interactions[interactions['variant'] == 'A']),
-                    "unique_listings": int(interactions[interactions['variant'] == 'A']['listing_id'].nunique()) if 'listing_id' in interactions.columns else 0
-                },
-                "variant_B": {
-                    "count": len(interactions[interactions['variant'] == 'B']),
-                    "unique_listings": int(interactions[interactions['variant'] == 'B']['listing_id'].nunique()) if 'listing_id' in interactions.columns else 0
-                }
-            }
-            
-            if 'feedback' in self.log_df.columns and 'rating' in self.log_df.columns:
-                feedback = self.log_df[self.log_df['feedback'] == True]
-                if not feedback.empty:
-                    for variant in ['A', 'B']:
-                        variant_feedback = feedback[feedback['variant'] == variant]
-                        if not variant_feedback.empty:
-                            stats[f"variant_{variant}"]["avg_rating"] = float(variant_feedback['rating'].mean())
-                            stats[f"variant_{variant}"]["feedback_count"] = len(variant_feedback)
-            
-            return stats
-            
+            return self.stats.snapshot()
+        
         except Exception as e:
             logger.error(f"Statistics error: {str(e)}")
             return {"error": str(e)}
     
-    def get_log(self, variant=None, limit=None):
+    def iter_log(self, cursor=0, variant=None, listing_id=None, since=None, until=None, feedback=None):
+        # Yields (offset, record). The log is append-only and chronological, so an
+        # offset is a stable cursor and a time range is located by bisection.
+        records = self.records
+        end = len(records)
+        start = max(cursor, 0)
+        if since:
+            start = max(start, bisect.bisect_left(records, since, 0, end, key=_timestamp))
+        if listing_id is not None:
+            listing_id = str(listing_id)
+        
+        for offset in range(start, end):
+            record = records[offset]
+            if until and _timestamp(record) > until:
+                break
+            if variant and record.get('variant') != variant:
+                continue
+            if listing_id is not None and str(record.get('listing_id')) != listing_id:
+                continue
+            if feedback is not None and is_feedback(record) != feedback:
+                continue
+            yield offset, clean_record(record)
+    
+    def get_log(self, variant=None, limit=DEFAULT_PAGE_SIZE, cursor=0, listing_id=None, since=None, until=None,
+                feedback=None):
         try:
-            df = self.log_df.copy()
-            
-            if variant:
-                df = df[df['variant'] == variant]
-            
-            if limit:
-                df = df.tail(limit)
-            
-            return df.to_dict('records')
+            page = []
+            next_cursor = None
+            for offset, record in self.iter_log(cursor, variant, listing_id, since, until, feedback):
+                if len(page) >= limit:
+                    next_cursor = offset
+                    break
+                page.append(record)
             
+            return page, next_cursor
+        
         except Exception as e:
             logger.error(f"Get log error: {str(e)}")
-            return []
+            return [], None
+
+
+class SQLiteABTestManager(ABTestManager):
+    # Same API backed by the indexed SQLite log instead of an in-memory list + CSV.
+    # Every worker reads and writes the same database, so /ab_log and /ab_stats
+    # agree across processes. The first start imports the existing ab_log.csv.
+    def __init__(self, db_file='ab_log.db', log_file='ab_log.csv', state_file='ab_state.db'):
+        self.db_file = db_file
+        self._stats_id = 0
+        self._stats_lock = threading.Lock()
+        super().__init__(log_file, state_file)
+    
+    def _open_sink(self):
+        return SQLiteLogStore(self.db_file)
+    
+    def _load_log(self):
+        try:
+            self.sink.migrate_csv(self.log_file)
+        except Exception as e:
+            logger.warning(f"Could not migrate {self.log_file}: {e}")
+        self._sync_stats()
+        logger.info(f"Loaded A/B log: {self.record_count()} records from {self.db_file}")
+    
+    def _sync_stats(self):
+        # Folds in records written since the last call, by this or any other worker
+        with self._stats_lock:
+            for record_id, record in self.sink.iter_stat_rows(self._stats_id):
+                self.stats.update(record)
+                self._stats_id = record_id
+    
+    def _append(self, records):
+        self.sink.write_many(records)
+    
+    @property
+    def log_df(self):
+        return self.sink.dataframe()
+    
+    def record_count(self):
+        return self.sink.count()
+    
+    def get_statistics(self):
+        try:
+            self._sync_stats()
+            return self.stats.snapshot()
+        
+        except Exception as e:
+            logger.error(f"Statistics error: {str(e)}")
+            return {"error": str(e)}
+    
+    def iter_log(self, cursor=0, variant=None, listing_id=None, since=None, until=None, feedback=None):
+        # Offsets are record id - 1, matching the CSV backend
+        for record_id, record in self.sink.iter_records(max(cursor, 0), variant, listing_id, since, until, feedback):
+            yield record_id - 1, clean_record(record)
+
+
+def hash_variant(listing_id, allocation=DEFAULT_ALLOCATION):
+    listing_hash = int(hashlib.md5(str(listing_id).encode()).hexdigest(), 16)
+    variants = [variant for variant, _ in allocation]
+    weights = [weight for _, weight in allocation]
+    # Equal weights: hash % n, which for A/B is the original even/odd split
+    if len(set(weights)) == 1:
+        return variants[listing_hash % len(variants)]
+    
+    point = (listing_hash % HASH_BUCKETS) / HASH_BUCKETS * sum(weights)
+    for variant, weight in allocation:
+        if point < weight:
+            return variant
+        point -= weight
+    return variants[-1]
+
+
+def _timestamp(record):
+    return str(record.get('timestamp', ''))
+
+
+def clean_record(record):
+    # Records loaded from CSV carry NaN for empty cells, which is not valid JSON
+    return {k: (None if isinstance(v, float) and v != v else v) for k, v in record.items()}
@@ -1,19 +1,182 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import os
+import hmac
 import json
 import logging
-from datetime import datetime
+from datetime import date, datetime
+from collections import defaultdict
+from itertools import islice
 from models import ModelManager
-from ab_test import ABTestManager
+from ab_test import ABTestManager, SQLiteABTestManager, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from log_sink import FSYNC_POLICIES
+from chart import render_chart
+from result_cache import ResultCache
+from http_cache import ResponseCache
+from startup import Startup
+import metrics
+from metrics import stage
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-app.json.compact = False
+# Indented JSON only in debug mode
+app.json.compact = None
 app.json.sort_keys = False
-model_manager = ModelManager()
-ab_test_manager = ABTestManager()
+# Models and the A/B log are loaded in the background (see startup below); until both
+# are in, every endpoint except /health, /ready and /metrics answers 503
+# DATA_DIR: directory with model_*.csv / variants.json (default ../part1/artifacts/ab_test)
+model_manager = ModelManager(os.environ.get('DATA_DIR'), load=False)
+ab_test_manager = None
+# Results of /predict and /timeline per model version; RESULT_CACHE_SIZE=0 disables it
+result_cache = ResultCache(int(os.environ.get('RESULT_CACHE_SIZE', 10000)),
+                           int(os.environ.get('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024)))
+model_manager.on_reload(lambda snapshot: result_cache.clear())
+# ETags (304 on If-None-Match) and gzip/brotli for read endpoints; compressed bodies are cached per ETag
+response_cache = ResponseCache(int(os.environ.get('HTTP_CACHE_SIZE', 2000)),
+                               int(os.environ.get('HTTP_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+                               int(os.environ.get('COMPRESS_MIN_SIZE', 1024)))
+model_manager.on_reload(lambda snapshot: response_cache.clear())
+app.after_request(response_cache.compress_response)
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+LOOPBACK = {'127.0.0.1', '::1'}
+
+# Writer of ab_log.csv: fsync policy (batch | interval | never), rotation to a timestamped file once
+# the live one reaches AB_LOG_ROTATE_BYTES and/or at the first write of a new day, batch and queue size.
+# Rotated segments are still loaded at startup, so for long histories AB_LOG_BACKEND=sqlite fits better
+AB_LOG_OPTIONS = {
+    'fsync': os.environ.get('AB_LOG_FSYNC', 'interval'),
+    'fsync_interval': float(os.environ.get('AB_LOG_FSYNC_INTERVAL', 5)),
+    'rotate_bytes': int(os.environ['AB_LOG_ROTATE_BYTES']) if os.environ.get('AB_LOG_ROTATE_BYTES') else None,
+    'rotate_daily': os.environ.get('AB_LOG_ROTATE_DAILY', '').lower() in ('1', 'true'),
+    'batch_size': int(os.environ.get('AB_LOG_BATCH_SIZE', 256)),
+    'max_queue': int(os.environ.get('AB_LOG_MAX_QUEUE', 10000))
+}
+if AB_LOG_OPTIONS['fsync'] not in FSYNC_POLICIES:
+    raise ValueError(f"AB_LOG_FSYNC must be one of {FSYNC_POLICIES}, got {AB_LOG_OPTIONS['fsync']!r}")
+
+MAX_BATCH_SIZE = 500
+MAX_LEADERBOARD_SIZE = 500
+
+# ONLINE_INFERENCE=1 computes aspects on demand for listings missing from the artifacts, from
+# "reviews" in the request body or from ONLINE_REVIEWS_FILE (reviews.csv: listing_id, comments)
+online_inference = None
+if os.environ.get('ONLINE_INFERENCE', '').lower() in ('1', 'true'):
+    from online import OnlineInference
+    online_inference = OnlineInference(
+        model_manager.data_dir,
+        reviews_file=os.environ.get('ONLINE_REVIEWS_FILE'),
+        max_entries=int(os.environ.get('ONLINE_CACHE_SIZE', 1024)),
+        ttl=float(os.environ.get('ONLINE_CACHE_TTL', 3600))
+    )
+    model_manager.on_reload(online_inference.refresh)
+
+# PROFILE_SAMPLE_RATE (0..1) profiles that share of requests; once set, X-Profile: 1 forces one
+request_profiler = None
+if os.environ.get('PROFILE_SAMPLE_RATE') is not None:
+    request_profiler = metrics.RequestProfiler(float(os.environ['PROFILE_SAMPLE_RATE']))
+metrics.init_app(app, request_profiler)
+
+def _load_models():
+    model_manager.load()
+    if online_inference is not None:
+        # Indexes ONLINE_REVIEWS_FILE in the background; readiness does not wait for it
+        online_inference.refresh(model_manager.snapshot)
+    if os.environ.get('MODEL_WATCH_INTERVAL'):
+        model_manager.start_watcher(float(os.environ['MODEL_WATCH_INTERVAL']))
+
+def _load_ab_log():
+    global ab_test_manager
+    # AB_LOG_BACKEND=sqlite keeps the log in ab_log.db (indexed, shared by workers) instead of ab_log.csv
+    if os.environ.get('AB_LOG_BACKEND', 'csv') == 'sqlite':
+        ab_test_manager = SQLiteABTestManager()
+    else:
+        ab_test_manager = ABTestManager(**AB_LOG_OPTIONS)
+
+startup = Startup(retry_interval=float(os.environ.get('STARTUP_RETRY_INTERVAL', 10)))
+startup.add('models', _load_models)
+startup.add('ab_log', _load_ab_log)
+startup.start()
+
+ALWAYS_AVAILABLE = {'health', 'ready', 'metrics_endpoint'}
+
+@app.before_request
+def _require_ready():
+    if not startup.ready and request.endpoint not in ALWAYS_AVAILABLE:
+        response = jsonify({"error": "Service is starting", **startup.status()})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+
+def _model_sizes(field):
+    status = model_manager.get_status().get('models') or {}
+    return {(variant,): info[field] for variant, info in status.items() if info}
+
+metrics.registry.gauge('model_records', 'Rows in the loaded model artifact', lambda: _model_sizes('records'), ('variant',))
+metrics.registry.gauge('model_listings', 'Listings in the loaded model artifact', lambda: _model_sizes('listings'), ('variant',))
+metrics.registry.gauge('model_memory_bytes', 'Model array bytes on the heap vs memory-mapped',
+                       lambda: {(k,): v for k, v in model_manager.snapshot.memory_usage().items()}, ('kind',))
+metrics.registry.gauge('model_generation', 'Number of model loads since start', lambda: model_manager.generation)
+metrics.registry.gauge('ab_log_records', 'Records in the A/B log', lambda: ab_test_manager.record_count())
+metrics.registry.gauge('ab_log_pending', 'A/B log records waiting to be written', lambda: ab_test_manager.sink.pending())
+metrics.registry.gauge('ab_log_written', 'A/B log records written by this process', lambda: ab_test_manager.sink.written)
+metrics.registry.gauge('ab_log_dropped', 'A/B log records dropped (queue full or closed)', lambda: ab_test_manager.sink.dropped)
+metrics.registry.gauge('result_cache_entries', 'Cached /predict and /timeline results', lambda: len(result_cache))
+metrics.registry.gauge('result_cache_bytes', 'Approximate size of cached results', lambda: result_cache.bytes)
+metrics.registry.gauge('result_cache_hits', 'Result cache hits', lambda: result_cache.hits)
+metrics.registry.gauge('result_cache_misses', 'Result cache misses', lambda: result_cache.misses)
+metrics.registry.gauge('result_cache_evictions', 'Result cache LRU evictions', lambda: result_cache.evictions)
+metrics.registry.gauge('result_cache_coalesced', 'Requests that waited for an identical computation in flight', lambda: result_cache.coalesced)
+metrics.registry.gauge('http_cache_entries', 'Cached response bodies and compressed variants', lambda: len(response_cache))
+metrics.registry.gauge('http_cache_bytes', 'Size of cached response bodies', lambda: response_cache.cache.bytes)
+metrics.registry.gauge('http_not_modified', 'Requests answered with 304 Not Modified', lambda: response_cache.not_modified)
+if online_inference is not None:
+    metrics.registry.gauge('online_cache_entries', 'Online inference results in cache', lambda: len(online_inference.cache))
+    metrics.registry.gauge('online_cache_hits', 'Online inference cache hits', lambda: online_inference.cache.hits)
+    metrics.registry.gauge('online_cache_misses', 'Online inference cache misses', lambda: online_inference.cache.misses)
+    metrics.registry.gauge('online_review_listings', 'Listings in the online inference review index', lambda: len(online_inference.reviews))
+metrics.registry.gauge('startup_ready', '1 once models and the A/B log are loaded', lambda: int(startup.ready))
+metrics.registry.gauge('process_resident_memory_bytes', 'Resident set size', lambda: model_manager.get_status()['rss_bytes'])
+
+def cached(kind, key, compute):
+    # Keys carry the model version, so a reload never serves results of the previous snapshot
+    try:
+        hash(key)
+    except TypeError:
+        return compute()
+    return result_cache.get_or_compute((kind, model_manager.version) + key, compute)
+
+def cached_timeline(listing_id):
+    return cached('timeline', (str(listing_id),), lambda: model_manager.get_timeline_data(listing_id))
+
+def _parse_date(value):
+    # Whole value must parse: a date, or a datetime whose date part is used
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid date: {value!r}")
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        return datetime.fromisoformat(value).date().isoformat()
+
+def _model_state():
+    return model_manager.version
+
+def _log_state():
+    # The log is append-only, so its length identifies its content; ndjson exports are streamed, not cached
+    if request.args.get('format') == 'ndjson':
+        return None
+    return ab_test_manager.record_count()
+
+@app.route('/health', methods=['GET'])
+def health():
+    # Liveness: the process serves requests, whether or not loading has finished
+    return jsonify({"status": "ok"})
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    # Readiness with loading progress; 503 until models and the A/B log are loaded
+    status = {**startup.status(), "models": dict(model_manager.progress)}
+    return jsonify(status), 200 if startup.ready else 503
 
 @app.route('/predict', methods=['POST'])
 def predict():
@@ -24,17 +187,37 @@ def predict():
         
         listing_id = data['listing_id']
         top_k = data.get('top_k', 3)
+        reviews = data.get('reviews')
+        if reviews is not None and (not isinstance(reviews, list) or not all(isinstance(r, str) for r in reviews)):
+            return jsonify({"error": "'reviews' must be a list of strings"}), 400
+        
+        # Optional date window (inclusive, YYYY-MM-DD or an ISO datetime); without it the whole history is aggregated
+        try:
+            date_from, date_to = (_parse_date(data[key]) if data.get(key) else None for key in ('from', 'to'))
+            if date_from and date_to and date_from > date_to:
+                raise ValueError("'from' is after 'to'")
+        except ValueError as e:
+            return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
+        windowed = date_from is not None or date_to is not None
         
-        model_variant = ab_test_manager.assign_variant(listing_id)
-        result = model_manager.predict(listing_id, top_k, model_variant)
+        with stage('assign_variant'):
+            model_variant = ab_test_manager.assign_variant(listing_id, model_manager.allocation(),
+                                                           model_manager.available_variants())
+        with stage('model_predict'):
+            result = cached('predict', (str(listing_id), top_k, model_variant, date_from, date_to),
+                            lambda: model_manager.predict(listing_id, top_k, model_variant, date_from, date_to))
+        if result is None and online_inference is not None and not windowed:
+            with stage('online_predict'):
+                result = online_inference.predict(listing_id, top_k, model_variant, reviews)
         
         if result is None:
             return jsonify({"error": f"No data for listing {listing_id}"}), 404
         
-        ab_test_manager.log_interaction(
-            listing_id, model_variant,
-            result['top_aspects'], result['bottom_aspects']
-        )
+        with stage('log_interaction'):
+            ab_test_manager.log_interaction(
+                listing_id, model_variant,
+                result['top_aspects'], result['bottom_aspects']
+            )
         
         response = {
             "listing_id": listing_id,
@@ -44,30 +227,129 @@ def predict():
             "chart_url": f"/predict/chart?listing_id={listing_id}",
             "timestamp": datetime.now().isoformat()
         }
+        if windowed:
+            response["from"], response["to"] = date_from, date_to
+        if result.get('source'):
+            response["source"] = result['source']
         
         logger.info(f"Prediction: listing {listing_id}, model {model_variant}")
         return jsonify(response)
-        
+    
     except Exception as e:
         logger.error(f"Prediction error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('listing_ids'), list):
+            return jsonify({"error": "Missing 'listing_ids' list"}), 400
+        
+        listing_ids = data['listing_ids']
+        top_k = data.get('top_k', 3)
+        if len(listing_ids) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"At most {MAX_BATCH_SIZE} listing_ids per batch"}), 400
+        
+        results = [None] * len(listing_ids)
+        by_variant = defaultdict(list)
+        allocation, available = model_manager.allocation(), model_manager.available_variants()
+        for i, listing_id in enumerate(listing_ids):
+            try:
+                int(listing_id)
+            except (TypeError, ValueError):
+                results[i] = {"listing_id": listing_id, "status": 400, "error": "Invalid listing_id"}
+                continue
+            with stage('assign_variant'):
+                by_variant[ab_test_manager.assign_variant(listing_id, allocation, available)].append(i)
+        
+        interactions = []
+        for variant, positions in by_variant.items():
+            with stage('model_predict_batch'):
+                predictions = model_manager.predict_batch([listing_ids[i] for i in positions], top_k, variant)
+            for i, result in zip(positions, predictions):
+                listing_id = listing_ids[i]
+                if result is None:
+                    results[i] = {"listing_id": listing_id, "status": 404, "error": f"No data for listing {listing_id}"}
+                    continue
+                
+                interactions.append((listing_id, variant, result['top_aspects'], result['bottom_aspects']))
+                results[i] = {
+                    "listing_id": listing_id,
+                    "status": 200,
+                    "top_aspects": result['top_aspects'],
+                    "bottom_aspects": result['bottom_aspects'],
+                    "chart_url": f"/predict/chart?listing_id={listing_id}"
+                }
+        
+        with stage('log_interaction'):
+            ab_test_manager.log_interactions(interactions)
+        
+        logger.info(f"Batch prediction: {len(listing_ids)} listings, {len(interactions)} found")
+        return jsonify({
+            "top_k": top_k,
+            "count": len(results),
+            "results": results,
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        logger.error(f"Batch prediction error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/ab_stats', methods=['GET'])
+@response_cache.conditional(_log_state)
 def ab_stats():
     try:
-        return jsonify(ab_test_manager.get_statistics())
+        with stage('ab_statistics'):
+            stats = ab_test_manager.get_statistics()
+        return jsonify(stats)
     except Exception as e:
         logger.error(f"Stats error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/ab_log', methods=['GET'])
+@response_cache.conditional(_log_state)
 def ab_log():
     try:
-        variant = request.args.get('variant')
-        limit = int(request.args.get('limit')) if request.args.get('limit') else None
-        log_data = ab_test_manager.get_log(variant, limit)
+        args = request.args
+        try:
+            cursor = int(args.get('cursor', 0))
+            limit = min(int(args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+            if limit < 1 or cursor < 0:
+                raise ValueError("limit must be positive and cursor must not be negative")
+            for value in (args.get('since'), args.get('until')):
+                if value:
+                    datetime.fromisoformat(value)
+            feedback = args.get('feedback')
+            if feedback is not None and feedback not in ('true', 'false'):
+                raise ValueError("feedback must be true or false")
+        except ValueError as e:
+            return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
         
-        return jsonify({"total_records": len(log_data), "log": log_data})
+        filters = {
+            'variant': args.get('variant'),
+            'listing_id': args.get('listing_id'),
+            'since': args.get('since'),
+            'until': args.get('until'),
+            'feedback': None if feedback is None else feedback == 'true'
+        }
+        
+        if args.get('format') == 'ndjson':
+            # Streams one record per line; without an explicit limit runs to the end of the log
+            records = ab_test_manager.iter_log(cursor, **filters)
+            if 'limit' in args:
+                records = islice(records, limit)
+            
+            def generate():
+                for offset, record in records:
+                    yield json.dumps({"offset": offset, **record}) + "\n"
+            
+            return Response(generate(), mimetype='application/x-ndjson')
+        
+        log_data, next_cursor = ab_test_manager.get_log(limit=limit, cursor=cursor, **filters)
+        
+        return jsonify({"total_records": len(log_data), "next_cursor": next_cursor, "log": log_data})
     except Exception as e:
         logger.error(f"Log error: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -79,276 +361,125 @@ def feedback():
         if not data or 'listing_id' not in data or 'rating' not in data:
             return jsonify({"error": "Missing listing_id or rating"}), 400
         
-        ab_test_manager.log_feedback(
-            data['listing_id'], 
-            data['rating'], 
-            data.get('comment', '')
-        )
+        with stage('log_feedback'):
+            ab_test_manager.log_feedback(
+                data['listing_id'], 
+                data['rating'], 
+                data.get('comment', '')
+            )
         
         return jsonify({"status": "success"})
-        
+    
     except Exception as e:
         logger.error(f"Feedback error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/timeline', methods=['GET'])
+@response_cache.conditional(_model_state)
 def timeline():
     try:
         listing_id = request.args.get('listing_id')
         if not listing_id:
             return jsonify({"error": "Missing listing_id"}), 400
         
-        return jsonify(model_manager.get_timeline_data(listing_id))
+        with stage('timeline'):
+            timeline_data = cached_timeline(listing_id)
+        return jsonify(timeline_data)
     except Exception as e:
         logger.error(f"Timeline error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/aspects/<aspect>/top', methods=['GET'])
+@response_cache.conditional(_model_state)
+def aspect_top(aspect):
+    try:
+        args = request.args
+        try:
+            limit = min(int(args.get('limit', 50)), MAX_LEADERBOARD_SIZE)
+            offset = int(args.get('offset', 0))
+            min_mentions = int(args.get('min_mentions', 0))
+            if limit < 0 or offset < 0:
+                raise ValueError("limit and offset must not be negative")
+            order = args.get('order', 'best')
+            if order not in ('best', 'worst'):
+                raise ValueError("order must be best or worst")
+        except ValueError as e:
+            return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
+        
+        variant = args.get('variant', 'A')
+        with stage('leaderboard'):
+            result = model_manager.top_listings(aspect, variant, limit, offset, min_mentions, order == 'worst')
+        if result is None:
+            return jsonify({"error": f"No aspect {aspect} in model {variant}", "aspects": model_manager.get_aspects(variant)}), 404
+        
+        return jsonify({**result, "limit": limit})
+    except Exception as e:
+        logger.error(f"Leaderboard error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/predict/chart', methods=['GET'])
+@response_cache.conditional(_model_state)
 def predict_chart():
     try:
         listing_id = request.args.get('listing_id')
         if not listing_id:
             return "<html><body><h1>Error</h1><p>Missing listing_id</p></body></html>", 400
         
-        timeline_data = model_manager.get_timeline_data(listing_id)
-        html_template = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Timeline - Listing {{ listing_id }}</title>
-            <script src="https://cdn.plot.ly/plotly-2.27.0.min.js"></script>
-            <style>
-                body {
-                    font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, sans-serif;
-                    margin: 0;
-                    padding: 20px;
-                    background: #f5f5f5;
-                    min-height: 100vh;
-                }
-                .container {
-                    max-width: 1800px;
-                    margin: 0 auto;
-                    background-color: white;
-                    padding: 30px;
-                    border-radius: 8px;
-                    box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-                }
-                h1 {
-                    color: #333;
-                    text-align: center;
-                    margin-bottom: 10px;
-                    font-size: 28px;
-                }
-                .stats {
-                    text-align: center;
-                    color: #666;
-                    margin: 15px 0 30px 0;
-                    font-size: 14px;
-                }
-                #chart {
-                    margin-top: 20px;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>Timeline: Listing {{ listing_id }}</h1>
-                
-                <div class="stats">
-                    Days: {{ total_days }} | Baseline total: {{ total_baseline }} | Advanced total: {{ total_advanced }}
-                </div>
-                
-                <div id="chart"></div>
-                
-                <script>
-                    var dates_baseline = {{ dates_baseline | safe }};
-                    var counts_baseline = {{ counts_baseline | safe }};
-                    var dates_advanced = {{ dates_advanced | safe }};
-                    var counts_advanced = {{ counts_advanced | safe }};
-                    var scores_baseline = {{ scores_baseline | safe }};
-                    var scores_advanced = {{ scores_advanced | safe }};
-                    
-                    // Calculate cumulative sums
-                    function cumsum(arr) {
-                        var result = [];
-                        var sum = 0;
-                        for (var i = 0; i < arr.length; i++) {
-                            sum += arr[i];
-                            result.push(sum);
-                        }
-                        return result;
-                    }
-                    
-                    var cumulative_baseline = cumsum(counts_baseline);
-                    var cumulative_advanced = cumsum(counts_advanced);
-                    
-                    // Cumulative aspects traces
-                    var trace_cumulative_baseline = {
-                        x: dates_baseline,
-                        y: cumulative_baseline,
-                        type: 'scatter',
-                        mode: 'lines',
-                        name: 'Baseline (TF-IDF)',
-                        line: {color: '#3498db', width: 2.5, shape: 'hv'},
-                        fill: 'tozeroy',
-                        fillcolor: 'rgba(52, 152, 219, 0.2)',
-                        xaxis: 'x',
-                        yaxis: 'y',
-                        hovertemplate: '<b>%{x}</b><br>Cumulative: %{y}<extra></extra>'
-                    };
-                    
-                    var trace_cumulative_advanced = {
-                        x: dates_advanced,
-                        y: cumulative_advanced,
-                        type: 'scatter',
-                        mode: 'lines',
-                        name: 'Advanced (Embeddings)',
-                        line: {color: '#e74c3c', width: 2.5, shape: 'hv'},
-                        fill: 'tozeroy',
-                        fillcolor: 'rgba(231, 76, 60, 0.2)',
-                        xaxis: 'x2',
-                        yaxis: 'y2',
-                        hovertemplate: '<b>%{x}</b><br>Cumulative: %{y}<extra></extra>'
-                    };
-                    
-                    // Score traces
-                    var trace_score_baseline = {
-                        x: dates_baseline,
-                        y: scores_baseline,
-                        type: 'scatter',
-                        mode: 'lines',
-                        name: 'Baseline Score',
-                        line: {color: '#3498db', width: 2, shape: 'hv'},
-                        fill: 'tozeroy',
-                        fillcolor: 'rgba(52, 152, 219, 0.15)',
-                        xaxis: 'x3',
-                        yaxis: 'y3',
-                        hovertemplate: '<b>%{x}</b><br>Score: %{y}<extra></extra>'
-                    };
-                    
-                    var trace_score_advanced = {
-                        x: dates_advanced,
-                        y: scores_advanced,
-                        type: 'scatter',
-                        mode: 'lines',
-                        name: 'Advanced Score',
-                        line: {color: '#e74c3c', width: 2, shape: 'hv'},
-                        fill: 'tozeroy',
-                        fillcolor: 'rgba(231, 76, 60, 0.15)',
-                        xaxis: 'x4',
-                        yaxis: 'y4',
-                        hovertemplate: '<b>%{x}</b><br>Score: %{y}<extra></extra>'
-                    };
-                    
-                    var layout = {
-                        grid: {rows: 4, columns: 1, pattern: 'independent', roworder: 'top to bottom'},
-                        height: 1200,
-                        showlegend: false,
-                        margin: {l: 60, r: 40, t: 20, b: 60},
-                        
-                        // Cumulative Baseline
-                        xaxis: {
-                            title: 'Date',
-                            showgrid: true,
-                            gridcolor: '#e0e0e0'
-                        },
-                        yaxis: {
-                            title: 'Cumulative Aspects (Baseline)',
-                            showgrid: true,
-                            gridcolor: '#e0e0e0'
-                        },
-                        
-                        // Cumulative Advanced
-                        xaxis2: {
-                            title: 'Date',
-                            showgrid: true,
-                            gridcolor: '#e0e0e0'
-                        },
-                        yaxis2: {
-                            title: 'Cumulative Aspects (Advanced)',
-                            showgrid: true,
-                            gridcolor: '#e0e0e0'
-                        },
-                        
-                        // Score Baseline
-                        xaxis3: {
-                            title: 'Date',
-                            showgrid: true,
-                            gridcolor: '#e0e0e0'
-                        },
-                        yaxis3: {
-                            title: 'Score (Baseline)',
-                            showgrid: true,
-                            gridcolor: '#e0e0e0',
-                            zeroline: true,
-                            zerolinecolor: '#999',
-                            zerolinewidth: 2
-                        },
-                        
-                        // Score Advanced
-                        xaxis4: {
-                            title: 'Date',
-                            showgrid: true,
-                            gridcolor: '#e0e0e0'
-                        },
-                        yaxis4: {
-                            title: 'Score (Advanced)',
-                            showgrid: true,
-                            gridcolor: '#e0e0e0',
-                            zeroline: true,
-                            zerolinecolor: '#999',
-                            zerolinewidth: 2
-                        },
-                        
-                        plot_bgcolor: '#fafafa',
-                        paper_bgcolor: 'white'
-                    };
-                    
-                    var config = {
-                        responsive: true,
-                        displayModeBar: true,
-                        displaylogo: false,
-                        modeBarButtonsToRemove: ['lasso2d', 'select2d']
-                    };
-                    
-                    Plotly.newPlot('chart', 
-                        [trace_cumulative_baseline, trace_cumulative_advanced, trace_score_baseline, trace_score_advanced], 
-                        layout, 
-                        config
-                    );
-                </script>
-            </div>
-        </body>
-        </html>
-        """
-        
-        baseline = timeline_data['baseline']
-        advanced = timeline_data['advanced']
-        
-        template_vars = {
-            'listing_id': listing_id,
-            'total_days': max(len(baseline['dates']), len(advanced['dates'])) if baseline['dates'] or advanced['dates'] else 0,
-            'total_baseline': sum(baseline['counts']) if baseline['counts'] else 0,
-            'total_advanced': sum(advanced['counts']) if advanced['counts'] else 0,
-            'dates_baseline': json.dumps(baseline['dates']),
-            'counts_baseline': json.dumps(baseline['counts']),
-            'scores_baseline': json.dumps(baseline['scores']),
-            'dates_advanced': json.dumps(advanced['dates']),
-            'counts_advanced': json.dumps(advanced['counts']),
-            'scores_advanced': json.dumps(advanced['scores'])
-        }
-        
-        html = html_template
-        for key, value in template_vars.items():
-            html = html.replace('{{ ' + key + ' | safe }}', str(value))
-            html = html.replace('{{ ' + key + ' }}', str(value))
-        
+        with stage('chart_render'):
+            html = render_chart(listing_id, cached_timeline(listing_id))
         return html
-        
+    
     except Exception as e:
         logger.error(f"Chart error: {str(e)}")
         return f"<html><body><h1>Error</h1><pre>{str(e)}</pre></body></html>", 500
 
+def _admin_allowed():
+    # With ADMIN_TOKEN set the token is required; without it only direct loopback clients
+    # are allowed (requests relayed by a proxy carry X-Forwarded-For and are refused)
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), ADMIN_TOKEN.encode())
+    return request.remote_addr in LOOPBACK and 'X-Forwarded-For' not in request.headers
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    try:
+        if not _admin_allowed():
+            return jsonify({"error": "Forbidden"}), 403
+        
+        if request.args.get('wait') == 'true':
+            reloaded = model_manager.reload()
+            status = model_manager.get_status()
+            return jsonify({"reloaded": reloaded, **status}), 200 if reloaded else 409
+        
+        started = model_manager.reload_async()
+        return jsonify({"status": "started" if started else "already_running", "version": model_manager.version}), 202
+    
+    except Exception as e:
+        logger.error(f"Reload error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admin/models', methods=['GET'])
+def admin_models():
+    try:
+        if not _admin_allowed():
+            return jsonify({"error": "Forbidden"}), 403
+        return jsonify(model_manager.get_status())
+    except Exception as e:
+        logger.error(f"Model status error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profiles', methods=['GET'])
+def debug_profiles():
+    if not _admin_allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    if request_profiler is None:
+        return jsonify({"error": "Profiling disabled, set PROFILE_SAMPLE_RATE"}), 404
+    return jsonify({"sample_rate": request_profiler.sample_rate, "profiles": list(request_profiler.reports)})
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
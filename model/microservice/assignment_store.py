@@ -0,0 +1,92 @@
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class AssignmentStore:
+    # Listing -> variant assignments shared by every worker process on the host.
+    # SQLite in WAL mode lets readers run alongside a single writer; the first
+    # worker to insert an assignment wins and all others read it back, so a
+    # listing keeps one variant for the whole experiment, across restarts too,
+    # unless its variant stops being served (see reassign).
+    def __init__(self, db_file='ab_state.db', timeout=5.0):
+        self.db_file = db_file
+        self.timeout = timeout
+        self._local = threading.local()
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS assignments ("
+            " listing_id TEXT PRIMARY KEY,"
+            " variant TEXT NOT NULL,"
+            " assigned_at TEXT NOT NULL)"
+        )
+        conn.commit()
+    
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=self.timeout)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+    
+    def get(self, listing_id):
+        key = str(listing_id)
+        variant = self._cache.get(key)
+        if variant is not None:
+            return variant
+        
+        row = self._connection().execute(
+            "SELECT variant FROM assignments WHERE listing_id = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        # Assignments only change through reassign, which drops the cached entry
+        with self._cache_lock:
+            self._cache[key] = row[0]
+        return row[0]
+    
+    def get_or_assign(self, listing_id, choose):
+        variant = self.get(listing_id)
+        if variant is not None:
+            return variant
+        
+        key = str(listing_id)
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO assignments (listing_id, variant, assigned_at) VALUES (?, ?, ?)",
+                (key, choose(listing_id), datetime.now().isoformat()))
+        # Another process may have inserted first; its choice is the one that counts
+        return self.get(listing_id)
+    
+    def reassign(self, listing_id, stale, variant):
+        # Compare-and-set on the stale variant: when several workers notice the same
+        # dropped variant, the first update wins and the others read it back
+        key = str(listing_id)
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "UPDATE assignments SET variant = ?, assigned_at = ? WHERE listing_id = ? AND variant = ?",
+                (variant, datetime.now().isoformat(), key, stale))
+        with self._cache_lock:
+            self._cache.pop(key, None)
+        return self.get(listing_id)
+    
+    def counts(self):
+        rows = self._connection().execute(
+            "SELECT variant, COUNT(*) FROM assignments GROUP BY variant").fetchall()
+        return dict(rows)
+    
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,59 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import logging
+
+# Runs the app in-process from a scratch directory so the benchmark does not write to ab_log.csv
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(tempfile.mkdtemp(prefix='bench_batch_'))
+logging.disable(logging.INFO)
+
+import app as service
+
+
+def time_single(client, listing_ids, top_k):
+    start = time.perf_counter()
+    for listing_id in listing_ids:
+        client.post('/predict', json={"listing_id": listing_id, "top_k": top_k})
+    return time.perf_counter() - start
+
+
+def time_batch(client, listing_ids, top_k):
+    start = time.perf_counter()
+    client.post('/predict/batch', json={"listing_ids": listing_ids, "top_k": top_k})
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare N x /predict with one /predict/batch call")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20, 50, 100])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--top-k', type=int, default=3)
+    args = parser.parse_args()
+    
+    service.startup.wait()
+    listings = sorted(set().union(*(service.model_manager.get_available_listings(v)
+                                    for v in service.model_manager.variants)))
+    if not listings:
+        print("No models loaded")
+        return
+    
+    client = service.app.test_client()
+    for size in args.sizes:
+        single = batch = 0.0
+        for _ in range(args.rounds):
+            page = random.sample(listings, min(size, len(listings)))
+            single += time_single(client, page, args.top_k)
+            batch += time_batch(client, page, args.top_k)
+        
+        print(f"{size:>4} listings: {size} x /predict {single / args.rounds * 1000:8.2f}ms | "
+              f"/predict/batch {batch / args.rounds * 1000:8.2f}ms | speedup {single / batch:5.1f}x")
+    
+    service.ab_test_manager.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+from models import ModelManager, load_manifest
+
+# Request path used before the per-listing index: full-table filter + groupby + two sorts
+def predict_pandas(model_data, listing_id, top_k=3):
+    listing_data = model_data[model_data['listing_id'] == listing_id]
+    if listing_data.empty:
+        return None
+    
+    aspect_scores = listing_data.groupby('aspect').agg({
+        'score': 'sum',
+        'positive': 'sum',
+        'neutral': 'sum',
+        'negative': 'sum',
+        'total_mentions': 'sum'
+    }).reset_index()
+    
+    top_aspects = aspect_scores.sort_values('score', ascending=False).head(top_k).to_dict('records')
+    bottom_aspects = aspect_scores.sort_values('score', ascending=True).head(top_k).to_dict('records')
+    return top_aspects, bottom_aspects
+
+
+def run(fn, listing_ids):
+    timings = np.empty(len(listing_ids))
+    for i, listing_id in enumerate(listing_ids):
+        start = time.perf_counter()
+        fn(listing_id)
+        timings[i] = time.perf_counter() - start
+    return timings
+
+
+def report(name, timings):
+    ms = timings * 1000
+    print(f"{name:>8}: total {ms.sum() / 1000:8.2f}s | mean {ms.mean():7.3f}ms | "
+          f"p50 {np.percentile(ms, 50):7.3f}ms | p99 {np.percentile(ms, 99):7.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ModelManager.predict over all listing_ids")
+    parser.add_argument('--data-dir', default=None)
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--limit', type=int, default=None, help="benchmark only the first N listings")
+    args = parser.parse_args()
+    
+    start = time.perf_counter()
+    manager = ModelManager(args.data_dir)
+    print(f"ModelManager load: {time.perf_counter() - start:.2f}s")
+    
+    for entry in load_manifest(manager.data_dir):
+        variant = entry['name']
+        csv_path = os.path.join(manager.data_dir, f"{entry['model']}.csv")
+        if not os.path.exists(csv_path):
+            continue
+        model_data = pd.read_csv(csv_path)
+        model_data['listing_id'] = model_data['listing_id'].astype(int)
+        listing_ids = manager.get_available_listings(variant)[:args.limit]
+        print(f"\nVariant {variant}: {len(model_data)} rows, {len(listing_ids)} listings")
+        
+        before = run(lambda lid: predict_pandas(model_data, lid, args.top_k), listing_ids)
+        after = run(lambda lid: manager.predict(lid, args.top_k, variant), listing_ids)
+        
+        report('before', before)
+        report('after', after)
+        print(f"Speedup: {before.sum() / after.sum():.1f}x")
+
+
+if __name__ == '__main__':
+    main()
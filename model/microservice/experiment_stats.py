@@ -0,0 +1,125 @@
+import math
+import hashlib
+import threading
+
+EXACT_UNIQUE_LIMIT = 100000
+
+
+class HyperLogLog:
+    # Fixed-size distinct counter (~0.8% standard error at p=14, 16 KiB)
+    def __init__(self, p=14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+        self._alpha = 0.7213 / (1 + 1.079 / self.m)
+    
+    def add(self, value):
+        x = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        idx = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+    
+    def __len__(self):
+        estimate = self._alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+
+class VariantStats:
+    def __init__(self, exact_limit=EXACT_UNIQUE_LIMIT):
+        self.exact_limit = exact_limit
+        self.count = 0
+        self.feedback_count = 0
+        self.rating_sum = 0.0
+        self.rating_sq_sum = 0.0
+        self.listings = set()
+    
+    def add_interaction(self, listing_id):
+        self.count += 1
+        self.listings.add(str(listing_id))
+        # Past the limit an exact set costs too much memory; switch to a sketch
+        if isinstance(self.listings, set) and len(self.listings) > self.exact_limit:
+            sketch = HyperLogLog()
+            for value in self.listings:
+                sketch.add(value)
+            self.listings = sketch
+    
+    def add_feedback(self, rating):
+        self.feedback_count += 1
+        self.rating_sum += rating
+        self.rating_sq_sum += rating * rating
+    
+    def to_dict(self):
+        result = {
+            "count": self.count,
+            "unique_listings": len(self.listings)
+        }
+        if self.feedback_count:
+            mean = self.rating_sum / self.feedback_count
+            variance = max(self.rating_sq_sum / self.feedback_count - mean * mean, 0.0)
+            result["avg_rating"] = mean
+            result["rating_std"] = math.sqrt(variance)
+            result["feedback_count"] = self.feedback_count
+        return result
+
+
+class ExperimentStats:
+    # Running aggregates over the A/B log, updated per record so /ab_stats
+    # never rescans the log. Rebuilt once from the persisted log on startup.
+    def __init__(self, variants=('A', 'B'), exact_limit=EXACT_UNIQUE_LIMIT):
+        self.exact_limit = exact_limit
+        self.total_records = 0
+        self.total_interactions = 0
+        self.variants = {v: VariantStats(exact_limit) for v in variants}
+        self._lock = threading.Lock()
+    
+    def update(self, record):
+        variant = record.get('variant')
+        with self._lock:
+            self.total_records += 1
+            
+            if is_feedback(record):
+                rating = _to_float(record.get('rating'))
+                if rating is not None and self._variant(variant) is not None:
+                    self.variants[variant].add_feedback(rating)
+                return
+            
+            self.total_interactions += 1
+            if self._variant(variant) is not None:
+                self.variants[variant].add_interaction(record.get('listing_id'))
+    
+    def _variant(self, variant):
+        # Caller holds self._lock; variants from variants.json are added on first sight
+        if variant is None or variant == 'unknown' or variant != variant:
+            return None
+        if variant not in self.variants:
+            self.variants[variant] = VariantStats(self.exact_limit)
+        return self.variants[variant]
+    
+    def snapshot(self):
+        with self._lock:
+            if self.total_records == 0:
+                stats = {"total_interactions": 0}
+                stats.update({f"variant_{v}": {"count": 0} for v in self.variants})
+                return stats
+            
+            stats = {"total_interactions": self.total_interactions}
+            for variant, variant_stats in self.variants.items():
+                stats[f"variant_{variant}"] = variant_stats.to_dict()
+            return stats
+
+
+def is_feedback(record):
+    return record.get('feedback') in (True, 'True', 'true')
+
+
+def _to_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
@@ -0,0 +1,56 @@
+import argparse
+import os
+import time
+import logging
+import pandas as pd
+from models import ListingIndex, load_manifest
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Converts model_*.csv into the memory-mapped layout read by ModelManager:
+# <data_dir>/<model_name>/*.npy (numeric columns) + meta.json (aspect/date dictionaries).
+# Every worker maps the same files, so the page cache holds one copy for all of them.
+# All variants in variants.json are encoded against one aspect dictionary.
+
+def shared_aspects(data_dir, names):
+    aspects = set()
+    for name in names:
+        csv_path = os.path.join(data_dir, f'{name}.csv')
+        if os.path.exists(csv_path):
+            aspects.update(pd.read_csv(csv_path, usecols=['aspect'], dtype={'aspect': str})['aspect'].dropna())
+    return sorted(aspects)
+
+
+def export(data_dir, name, aspects=None):
+    csv_path = os.path.join(data_dir, f'{name}.csv')
+    if not os.path.exists(csv_path):
+        logger.error(f"Not found: {csv_path}")
+        return False
+    
+    start = time.time()
+    frame = pd.read_csv(csv_path)
+    frame['listing_id'] = frame['listing_id'].astype(int)
+    index = ListingIndex.from_frame(frame, aspects)
+    out_path = os.path.join(data_dir, name)
+    index.save(out_path, source=csv_path)
+    
+    logger.info(f"{csv_path} -> {out_path}: {index.n_rows} rows, {len(index)} listings, {time.time() - start:.2f}s")
+    return True
+
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Export model CSVs to memory-mapped columnar artifacts")
+    parser.add_argument('--data-dir', default=os.path.join(script_dir, '..', 'part1', 'artifacts', 'ab_test'))
+    args = parser.parse_args()
+    
+    data_dir = os.path.abspath(args.data_dir)
+    names = list(dict.fromkeys(v['model'] for v in load_manifest(data_dir)))
+    aspects = shared_aspects(data_dir, names)
+    ok = [export(data_dir, name, aspects) for name in names]
+    raise SystemExit(0 if all(ok) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,13 +6,12 @@ from models import ModelManager
 BASE = "http://localhost:8080"
 
 manager = ModelManager()
-listings_a = set(manager.model_a['listing_id'].unique()) if manager.model_a is not None else set()
-listings_b = set(manager.model_b['listing_id'].unique()) if manager.model_b is not None else set()
+listings = {variant: set(manager.get_available_listings(variant)) for variant in manager.variants}
 
-all_listings = list(listings_a | listings_b)
+all_listings = list(set().union(*listings.values()))
 
-print(f"Model A: {len(listings_a)} unique listings")
-print(f"Model B: {len(listings_b)} unique listings")
+for variant, ids in listings.items():
+    print(f"Model {variant}: {len(ids)} unique listings")
 print(f"Unique total: {len(all_listings)}")
 
 n = min(50, len(all_listings))
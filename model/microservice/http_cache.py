@@ -0,0 +1,106 @@
+import gzip
+import hashlib
+from functools import wraps
+from flask import Response, request, make_response
+from result_cache import ResultCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Levels for bodies compressed once and cached vs compressed on every response
+CACHED_LEVELS = {'br': 9, 'gzip': 9}
+DYNAMIC_LEVELS = {'br': 4, 'gzip': 6}
+
+
+def compress(body, encoding, levels=DYNAMIC_LEVELS):
+    if encoding == 'br':
+        return brotli.compress(body, quality=levels['br'])
+    return gzip.compress(body, compresslevel=levels['gzip'], mtime=0)
+
+
+def _body_size(entry):
+    return len(entry[2]) if isinstance(entry, tuple) else len(entry)
+
+
+class ResponseCache:
+    # Conditional GET and compression for read endpoints. A route decorated with
+    # conditional(state) gets a weak ETag derived from the endpoint, its query and
+    # state() (model version, A/B log length), so If-None-Match is answered with
+    # 304 before the view runs. Bodies and their gzip/brotli variants are cached
+    # per ETag; any other response above min_size is compressed on the fly.
+    def __init__(self, max_entries=2000, max_bytes=64 * 1024 * 1024, min_size=1024):
+        self.cache = ResultCache(max_entries, max_bytes, sizeof=_body_size)
+        self.min_size = min_size
+        self.not_modified = 0
+        self.encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    
+    def _negotiate(self):
+        return request.accept_encodings.best_match(self.encodings)
+    
+    def conditional(self, state):
+        # state() -> value the response depends on, or None to skip caching for this request
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                value = state()
+                if value is None:
+                    return view(*args, **kwargs)
+                
+                key = (request.endpoint, tuple(sorted(kwargs.items())),
+                       tuple(sorted(request.args.items(multi=True))), value)
+                etag = hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+                if request.if_none_match.contains_weak(etag):
+                    self.not_modified += 1
+                    response = Response(status=304)
+                else:
+                    response = self._cached_response(key, lambda: view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                
+                response.set_etag(etag, weak=True)
+                response.headers['Cache-Control'] = 'no-cache'
+                response.vary.add('Accept-Encoding')
+                return response
+            return wrapper
+        return decorator
+    
+    def _cached_response(self, key, render):
+        def freeze():
+            response = make_response(render())
+            return response.status_code, response.content_type, response.get_data()
+        
+        status, content_type, body = self.cache.get_or_compute(('body',) + key, freeze)
+        if status != 200:
+            # Errors are not kept; the next request recomputes
+            self.cache.discard(('body',) + key)
+            return Response(body, status=status, content_type=content_type)
+        
+        encoding = self._negotiate() if len(body) >= self.min_size else None
+        response = Response(status=status, content_type=content_type)
+        if encoding:
+            body = self.cache.get_or_compute((encoding,) + key, lambda: compress(body, encoding, CACHED_LEVELS))
+            response.headers['Content-Encoding'] = encoding
+        response.set_data(body)
+        return response
+    
+    def compress_response(self, response):
+        # after_request hook for everything not served from the cache
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers):
+            return response
+        
+        response.vary.add('Accept-Encoding')
+        encoding = self._negotiate()
+        if encoding is None or (response.content_length or 0) < self.min_size:
+            return response
+        response.set_data(compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+    
+    def clear(self):
+        self.cache.clear()
+    
+    def __len__(self):
+        return len(self.cache)
@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+from models import ModelManager
+
+# Load test for the microservice: starts app.py locally (or targets --url), drives a weighted
+# mix of endpoints from a thread pool and reports latency percentiles, throughput and errors as JSON.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MIX = "predict=60,feedback=10,timeline=15,ab_stats=10,ab_log=5"
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, weight = part.split('=')
+        weights[name.strip()] = float(weight)
+    unknown = set(weights) - set(ENDPOINTS)
+    if unknown:
+        raise ValueError(f"Unknown endpoints in mix: {sorted(unknown)}")
+    return weights
+
+
+def call_predict(session, base, listing_id, top_k):
+    return session.post(f"{base}/predict", json={"listing_id": listing_id, "top_k": top_k})
+
+
+def call_batch(session, base, listing_id, top_k, pick=None):
+    return session.post(f"{base}/predict/batch", json={"listing_ids": pick(20), "top_k": top_k})
+
+
+def call_feedback(session, base, listing_id, top_k):
+    return session.post(f"{base}/feedback", json={"listing_id": listing_id, "rating": random.randint(1, 5)})
+
+
+def call_timeline(session, base, listing_id, top_k):
+    return session.get(f"{base}/timeline", params={"listing_id": listing_id})
+
+
+def call_ab_stats(session, base, listing_id, top_k):
+    return session.get(f"{base}/ab_stats")
+
+
+def call_ab_log(session, base, listing_id, top_k):
+    return session.get(f"{base}/ab_log", params={"limit": 100})
+
+
+ENDPOINTS = {
+    'predict': call_predict,
+    'batch': call_batch,
+    'feedback': call_feedback,
+    'timeline': call_timeline,
+    'ab_stats': call_ab_stats,
+    'ab_log': call_ab_log,
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, data_dir=None, timeout=120):
+    # Scratch working directory, so the run does not append to the real ab_log.csv
+    workdir = tempfile.mkdtemp(prefix='loadtest_')
+    env = dict(os.environ, PORT=str(port))
+    if data_dir is not None:
+        env['DATA_DIR'] = os.path.abspath(data_dir)
+    proc = subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, 'app.py')], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        try:
+            if requests.get(f"{base}/ready", timeout=1).ok:
+                return proc, base
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    
+    proc.terminate()
+    raise RuntimeError("Server did not become ready in time")
+
+
+def make_picker(listing_ids, skew):
+    # skew=0 draws uniformly; skew>0 gives a Zipf-like popularity curve over a shuffled order
+    listing_ids = list(listing_ids)
+    random.shuffle(listing_ids)
+    weights = None
+    if skew > 0:
+        weights = (1.0 / np.arange(1, len(listing_ids) + 1) ** skew).tolist()
+    
+    def pick(n=1):
+        picked = random.choices(listing_ids, weights=weights, k=n)
+        return picked if n > 1 else picked[0]
+    return pick
+
+
+def summarize(samples, elapsed):
+    def stats(rows):
+        latencies = np.array([r[1] for r in rows]) * 1000
+        errors = sum(1 for r in rows if r[2] >= 500 or r[2] == 0)
+        not_found = sum(1 for r in rows if r[2] == 404)
+        return {
+            "requests": len(rows),
+            "throughput_rps": round(len(rows) / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(errors / len(rows), 4) if rows else 0.0,
+            "not_found": not_found,
+            "latency_ms": {
+                "mean": round(float(latencies.mean()), 3),
+                "p50": round(float(np.percentile(latencies, 50)), 3),
+                "p95": round(float(np.percentile(latencies, 95)), 3),
+                "p99": round(float(np.percentile(latencies, 99)), 3),
+                "max": round(float(latencies.max()), 3)
+            } if len(rows) else {}
+        }
+    
+    by_endpoint = {}
+    for row in samples:
+        by_endpoint.setdefault(row[0], []).append(row)
+    
+    return {
+        "duration_s": round(elapsed, 3),
+        "overall": stats(samples),
+        "endpoints": {name: stats(rows) for name, rows in sorted(by_endpoint.items())}
+    }
+
+
+def run(base, weights, pick, concurrency, duration, total, top_k, warmup):
+    names = list(weights)
+    probabilities = [weights[n] for n in names]
+    samples = []
+    samples_lock = threading.Lock()
+    stop_at = time.time() + warmup + duration
+    record_after = time.time() + warmup
+    remaining = [total] if total else None
+    
+    def worker():
+        session = requests.Session()
+        rows = []
+        while time.time() < stop_at:
+            if remaining is not None:
+                with samples_lock:
+                    if remaining[0] <= 0:
+                        break
+                    remaining[0] -= 1
+            
+            name = random.choices(names, weights=probabilities)[0]
+            fn = ENDPOINTS[name]
+            kwargs = {'pick': pick} if name == 'batch' else {}
+            start = time.perf_counter()
+            try:
+                status = fn(session, base, pick(), top_k, **kwargs).status_code
+            except requests.RequestException:
+                status = 0
+            latency = time.perf_counter() - start
+            if time.time() >= record_after:
+                rows.append((name, latency, status))
+        
+        with samples_lock:
+            samples.extend(rows)
+    
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.time() - start - warmup
+    return summarize(samples, max(elapsed, 1e-9))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the aspect microservice")
+    parser.add_argument('--url', default=None, help="target a running server instead of starting app.py")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds of measured load")
+    parser.add_argument('--requests', type=int, default=None, help="stop after N requests instead")
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"endpoint weights, default: {DEFAULT_MIX}")
+    parser.add_argument('--skew', type=float, default=0.0, help="Zipf exponent for listing popularity (0 = uniform)")
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--data-dir', default=None, help="models to pick listings from and, without --url, to serve")
+    parser.add_argument('--output', default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+    
+    weights = parse_mix(args.mix)
+    manager = ModelManager(args.data_dir)
+    listing_ids = sorted(set().union(*(manager.get_available_listings(v) for v in manager.variants)))
+    if not listing_ids:
+        raise SystemExit("No listings in the loaded models")
+    pick = make_picker(listing_ids, args.skew)
+    
+    proc = None
+    base = args.url
+    if base is None:
+        proc, base = start_server(free_port(), args.data_dir)
+    
+    try:
+        report = run(base, weights, pick, args.concurrency, args.duration, args.requests, args.top_k, args.warmup)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+    
+    report["config"] = {
+        "url": args.url or "local",
+        "concurrency": args.concurrency,
+        "mix": weights,
+        "skew": args.skew,
+        "listings": len(listing_ids)
+    }
+    
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
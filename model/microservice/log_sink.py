@@ -0,0 +1,238 @@
+import os
+import csv
+import glob
+import time
+import queue
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, date
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks (Windows): safe for one writer process only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOG_COLUMNS = [
+    'timestamp', 'listing_id', 'variant',
+    'top_aspects', 'bottom_aspects', 'top_scores', 'bottom_scores',
+    'rating', 'comment', 'feedback'
+]
+
+FSYNC_POLICIES = ('batch', 'interval', 'never')
+
+_STOP = object()
+
+
+def log_segments(log_file):
+    # Rotated files first (timestamped names sort chronologically), then the live file
+    base, ext = os.path.splitext(log_file)
+    rotated = sorted(glob.glob(f'{glob.escape(base)}.*{ext}'))
+    live = [log_file] if os.path.exists(log_file) else []
+    return rotated + live
+
+
+class LogSink:
+    # Append-only CSV writer for the A/B log. Requests only put records on a
+    # bounded queue; a background thread appends them in batches, so the cost
+    # of a request does not depend on how large the log already is.
+    def __init__(self, log_file, batch_size=256, flush_interval=1.0, max_queue=10000,
+                 fsync='interval', fsync_interval=5.0, rotate_bytes=None, rotate_daily=False,
+                 put_timeout=1.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        
+        self.log_file = log_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self.put_timeout = put_timeout
+        
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._writer = None
+        self._file_day = None
+        self._last_fsync = time.monotonic()
+        self._closed = False
+        
+        with self._locked():
+            self._upgrade_header()
+        self._thread = threading.Thread(target=self._run, name='ab-log-sink', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def segments(self):
+        return log_segments(self.log_file)
+    
+    def write(self, record):
+        if self._closed:
+            logger.error("Log sink is closed, record dropped")
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            logger.error("Log sink queue full, record dropped")
+            self.dropped += 1
+            return False
+    
+    def write_many(self, records):
+        # One queue slot for the whole batch
+        if records:
+            return self.write(list(records))
+        return True
+    
+    def flush(self):
+        # Blocks until everything queued so far is on disk
+        self._queue.join()
+    
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+    
+    def pending(self):
+        return self._queue.qsize()
+    
+    def _run(self):
+        batch = []
+        taken = 0
+        deadline = time.monotonic() + self.flush_interval
+        
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            
+            stop = item is _STOP
+            if item is not None:
+                taken += 1
+                if isinstance(item, list):
+                    batch.extend(item)
+                elif not stop:
+                    batch.append(item)
+            
+            if stop or len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if batch:
+                    self._write_batch(batch)
+                for _ in range(taken):
+                    self._queue.task_done()
+                batch = []
+                taken = 0
+                deadline = time.monotonic() + self.flush_interval
+            
+            if stop:
+                return
+    
+    @contextmanager
+    def _locked(self):
+        # Several worker processes may share one log: every append, header write and
+        # rotation happens under an exclusive lock on a sidecar file
+        if fcntl is None:
+            yield
+            return
+        with open(f'{self.log_file}.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _write_batch(self, batch):
+        try:
+            with self._locked():
+                self._reopen_if_moved()
+                self._maybe_rotate()
+                if self._file is None:
+                    self._open()
+                
+                self._writer.writerows(batch)
+                self._file.flush()
+            self.written += len(batch)
+            
+            now = time.monotonic()
+            if self.fsync == 'batch' or (self.fsync == 'interval' and now - self._last_fsync >= self.fsync_interval):
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+        
+        except Exception as e:
+            logger.error(f"Log sink write error: {str(e)}")
+    
+    def _reopen_if_moved(self):
+        # Another process may have rotated the file we hold open
+        if self._file is None:
+            return
+        try:
+            moved = os.stat(self.log_file).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            moved = True
+        if moved:
+            self._file.close()
+            self._file = None
+    
+    def _open(self):
+        new_file = not os.path.exists(self.log_file) or os.path.getsize(self.log_file) == 0
+        self._file = open(self.log_file, 'a', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=LOG_COLUMNS, restval='', extrasaction='ignore')
+        if new_file:
+            self._writer.writeheader()
+            self._file_day = date.today()
+        else:
+            self._file_day = datetime.fromtimestamp(os.path.getmtime(self.log_file)).date()
+    
+    def _maybe_rotate(self):
+        if not os.path.exists(self.log_file):
+            return
+        
+        too_big = self.rotate_bytes is not None and os.path.getsize(self.log_file) >= self.rotate_bytes
+        if self._file_day is None:
+            self._file_day = datetime.fromtimestamp(os.path.getmtime(self.log_file)).date()
+        new_day = self.rotate_daily and self._file_day != date.today()
+        if not (too_big or new_day):
+            return
+        
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+        
+        base, ext = os.path.splitext(self.log_file)
+        rotated = f"{base}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{ext}"
+        os.rename(self.log_file, rotated)
+        logger.info(f"Rotated A/B log to {rotated}")
+    
+    def _upgrade_header(self):
+        # Logs written before the sink existed only carry the columns seen so far;
+        # rewrite them once with the full header so appended rows line up.
+        if not os.path.exists(self.log_file) or os.path.getsize(self.log_file) == 0:
+            return
+        
+        with open(self.log_file, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames == LOG_COLUMNS:
+                return
+            rows = list(reader)
+        
+        tmp_file = f'{self.log_file}.tmp'
+        with open(tmp_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=LOG_COLUMNS, restval='', extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp_file, self.log_file)
+        logger.info(f"Upgraded {self.log_file} header to {len(LOG_COLUMNS)} columns")
@@ -0,0 +1,256 @@
+import os
+import json
+import sqlite3
+import logging
+import argparse
+import threading
+from log_sink import LOG_COLUMNS, log_segments
+from experiment_stats import is_feedback
+
+logger = logging.getLogger(__name__)
+
+# Indexed SQLite storage for the A/B log. One row per record; the top/bottom
+# aspect lists live in a child table instead of JSON strings, so queries by
+# variant, listing, time range or aspect use indexes rather than a full scan.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    listing_id INTEGER,
+    variant TEXT,
+    rating REAL,
+    comment TEXT,
+    feedback INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_records_timestamp ON records (timestamp);
+CREATE INDEX IF NOT EXISTS idx_records_variant ON records (variant, feedback, timestamp);
+CREATE INDEX IF NOT EXISTS idx_records_listing ON records (listing_id, timestamp);
+CREATE TABLE IF NOT EXISTS record_aspects (
+    record_id INTEGER NOT NULL,
+    side TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    aspect TEXT NOT NULL,
+    score REAL,
+    PRIMARY KEY (record_id, side, rank)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_record_aspects_aspect ON record_aspects (aspect, side);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+SIDES = ('top', 'bottom')
+# Stays under SQLite's bound-parameter limit in the aspect lookup
+FETCH_SIZE = 500
+
+
+class SQLiteLogStore:
+    # Drop-in for LogSink (write/write_many/flush/close/pending) that writes
+    # synchronously: a WAL commit is cheap and every worker sees the row at once.
+    def __init__(self, db_file='ab_log.db', timeout=5.0):
+        self.db_file = db_file
+        self.timeout = timeout
+        self.written = 0
+        self.dropped = 0
+        self._local = threading.local()
+        
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+    
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=self.timeout)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+    
+    def write(self, record):
+        return self.write_many([record])
+    
+    def write_many(self, records):
+        if not records:
+            return True
+        try:
+            conn = self._connection()
+            with conn:
+                self._insert(conn, records)
+            self.written += len(records)
+            return True
+        except Exception as e:
+            logger.error(f"Log store write error: {str(e)}")
+            self.dropped += len(records)
+            return False
+    
+    def _insert(self, conn, records):
+        for record in records:
+            cursor = conn.execute(
+                "INSERT INTO records (timestamp, listing_id, variant, rating, comment, feedback) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (str(record['timestamp']), _clean(record.get('listing_id')), _clean(record.get('variant')),
+                 _clean(record.get('rating')), _clean(record.get('comment')), int(is_feedback(record))))
+            
+            aspects = []
+            for side in SIDES:
+                names = _json_list(record.get(f'{side}_aspects'))
+                scores = _json_list(record.get(f'{side}_scores'))
+                for rank, name in enumerate(names):
+                    aspects.append((cursor.lastrowid, side, rank, name, scores[rank] if rank < len(scores) else None))
+            if aspects:
+                conn.executemany(
+                    "INSERT INTO record_aspects (record_id, side, rank, aspect, score) VALUES (?, ?, ?, ?, ?)",
+                    aspects)
+    
+    def flush(self):
+        pass
+    
+    def pending(self):
+        return 0
+    
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+    
+    def count(self):
+        # Records are never deleted, so ids are dense
+        return self._connection().execute("SELECT COALESCE(MAX(id), 0) FROM records").fetchone()[0]
+    
+    def migrate_csv(self, log_file):
+        # One-shot import of ab_log.csv (and rotated segments). Runs inside one
+        # IMMEDIATE transaction, so concurrent workers cannot import twice.
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute("SELECT value FROM meta WHERE key = 'migrated_from'").fetchone()
+            if done is not None:
+                conn.rollback()
+                return 0
+            
+            import pandas as pd
+            
+            frames = [pd.read_csv(path) for path in log_segments(log_file)]
+            records = []
+            if frames:
+                frame = pd.concat(frames, ignore_index=True)
+                frame = frame.sort_values('timestamp', kind='stable')
+                records = frame.to_dict('records')
+            
+            self._insert(conn, records)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_from', ?)", (os.path.abspath(log_file),))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        logger.info(f"Migrated {len(records)} records from {log_file} to {self.db_file}")
+        return len(records)
+    
+    def iter_records(self, after_id=0, variant=None, listing_id=None, since=None, until=None, feedback=None):
+        # Yields (id, record) in id order, records shaped like the CSV rows
+        where = ["id > ?"]
+        params = [after_id]
+        if variant:
+            where.append("variant = ?")
+            params.append(variant)
+        if listing_id is not None:
+            where.append("listing_id = ?")
+            params.append(str(listing_id))
+        if since:
+            where.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            where.append("timestamp <= ?")
+            params.append(until)
+        if feedback is not None:
+            where.append("feedback = ?")
+            params.append(int(feedback))
+        
+        conn = self._connection()
+        cursor = conn.execute(
+            "SELECT id, timestamp, listing_id, variant, rating, comment, feedback FROM records "
+            f"WHERE {' AND '.join(where)} ORDER BY id", params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                return
+            aspects = self._aspects(conn, [row[0] for row in rows])
+            for row in rows:
+                yield row[0], _to_record(row, aspects.get(row[0]))
+    
+    def _aspects(self, conn, ids):
+        lists = {}
+        placeholders = ','.join('?' * len(ids))
+        for record_id, side, aspect, score in conn.execute(
+                f"SELECT record_id, side, aspect, score FROM record_aspects "
+                f"WHERE record_id IN ({placeholders}) ORDER BY record_id, side, rank", ids):
+            entry = lists.setdefault(record_id, {'top': ([], []), 'bottom': ([], [])})
+            entry[side][0].append(aspect)
+            entry[side][1].append(score)
+        return lists
+    
+    def iter_stat_rows(self, after_id=0):
+        # Just the columns ExperimentStats needs: (id, record)
+        cursor = self._connection().execute(
+            "SELECT id, listing_id, variant, rating, feedback FROM records WHERE id > ? ORDER BY id", (after_id,))
+        for record_id, listing_id, variant, rating, feedback in cursor:
+            yield record_id, {'listing_id': listing_id, 'variant': variant, 'rating': rating, 'feedback': bool(feedback)}
+    
+    def dataframe(self, decode_lists=False):
+        import pandas as pd
+        
+        frame = pd.DataFrame([record for _, record in self.iter_records()], columns=LOG_COLUMNS)
+        if decode_lists:
+            for column in ('top_aspects', 'bottom_aspects', 'top_scores', 'bottom_scores'):
+                frame[column] = frame[column].apply(lambda v: json.loads(v) if isinstance(v, str) else [])
+        return frame
+
+
+def _to_record(row, aspects):
+    record_id, timestamp, listing_id, variant, rating, comment, feedback = row
+    record = {'timestamp': timestamp, 'listing_id': listing_id, 'variant': variant,
+              'top_aspects': None, 'bottom_aspects': None, 'top_scores': None, 'bottom_scores': None,
+              'rating': rating, 'comment': comment, 'feedback': True if feedback else None}
+    if not feedback:
+        aspects = aspects or {'top': ([], []), 'bottom': ([], [])}
+        for side in SIDES:
+            names, scores = aspects[side]
+            record[f'{side}_aspects'] = json.dumps(names)
+            record[f'{side}_scores'] = json.dumps(scores)
+    return record
+
+
+def _json_list(value):
+    if isinstance(value, list):
+        return value
+    if isinstance(value, str) and value:
+        return json.loads(value)
+    return []
+
+
+def _clean(value):
+    # NaN from CSV-loaded rows -> NULL
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import ab_log.csv into the indexed SQLite log")
+    parser.add_argument('--csv', default='ab_log.csv')
+    parser.add_argument('--db', default='ab_log.db')
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    store = SQLiteLogStore(args.db)
+    imported = store.migrate_csv(args.csv)
+    print(f"Imported {imported} records, {store.count()} in {args.db}")
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+import io
+import time
+import random
+import pstats
+import cProfile
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from flask import g, request
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value, *labels):
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][idx] += 1
+            series[1] += value
+    
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, ("le", _format_value(bound)))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class Gauge:
+    # Value(s) read at scrape time: fn returns a number or {label_values_tuple: number}
+    def __init__(self, name, help, fn, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.fn = fn
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        try:
+            values = self.fn()
+        except Exception:
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            if value is not None:
+                lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+    
+    def counter(self, *args, **kwargs):
+        return self._add(Counter(*args, **kwargs))
+    
+    def histogram(self, *args, **kwargs):
+        return self._add(Histogram(*args, **kwargs))
+    
+    def gauge(self, *args, **kwargs):
+        return self._add(Gauge(*args, **kwargs))
+    
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+    
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint', ('endpoint', 'method'))
+REQUESTS_TOTAL = registry.counter(
+    'http_requests_total', 'Requests by endpoint and status code', ('endpoint', 'method', 'status'))
+STAGE_LATENCY = registry.histogram(
+    'stage_duration_seconds', 'Latency of internal request stages', ('stage',))
+
+
+def stage(name):
+    return STAGE_LATENCY.time(name)
+
+
+class RequestProfiler:
+    # Profiles a random sample of requests with cProfile and keeps the most recent reports
+    def __init__(self, sample_rate=0.0, keep=50, top=25):
+        self.sample_rate = sample_rate
+        self.top = top
+        self.reports = deque(maxlen=keep)
+        self._active = threading.Lock()
+    
+    def start(self, force=False):
+        if not (force or (self.sample_rate > 0 and random.random() < self.sample_rate)):
+            return None
+        # Only one profiler can be active per interpreter
+        if not self._active.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            self._active.release()
+            return None
+        return profiler
+    
+    def abort(self, profiler):
+        profiler.disable()
+        self._active.release()
+    
+    def finish(self, profiler, endpoint, duration):
+        profiler.disable()
+        self._active.release()
+        
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(self.top)
+        self.reports.append({
+            'timestamp': datetime.now().isoformat(),
+            'endpoint': endpoint,
+            'duration_ms': round(duration * 1000, 3),
+            'profile': out.getvalue()
+        })
+
+
+def init_app(app, profiler=None):
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_profiler = profiler.start(request.headers.get('X-Profile') == '1') if profiler else None
+    
+    @app.after_request
+    def _record(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        duration = time.perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        
+        REQUEST_LATENCY.observe(duration, endpoint, request.method)
+        REQUESTS_TOTAL.inc(endpoint, request.method, str(response.status_code))
+        
+        active = g.pop('metrics_profiler', None)
+        if active is not None:
+            profiler.finish(active, endpoint, duration)
+        return response
+    
+    @app.teardown_request
+    def _release_profiler(exc):
+        # after_request is skipped on unhandled errors; do not leave the profiler running
+        active = g.pop('metrics_profiler', None)
+        if active is not None:
+            profiler.abort(active)
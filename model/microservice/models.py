@@ -1,131 +1,752 @@
-import pandas as pd
+import numpy as np
 import os
+import json
+import mmap
+import time
+import shutil
+import hashlib
 import logging
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+AGG_COLUMNS = ['score', 'positive', 'neutral', 'negative', 'total_mentions']
+MODEL_FILES = {'A': 'model_baseline', 'B': 'model_advanced2'}
+MANIFEST_FILE = 'variants.json'
+ARTIFACT_FORMAT = 6
+
+
+class ListingIndex:
+    # Aspect aggregates per listing, built once at load time. Rows of one
+    # listing are contiguous and ordered by score (desc, ties by aspect name),
+    # so a prediction is a dict lookup plus a top-k slice.
+    #
+    # agg_* arrays hold one row per (listing, aspect); row_offsets delimits each
+    # listing's raw artifact rows; tl_* arrays hold one row per (listing, date)
+    # for the timeline; win_* arrays hold the raw rows sorted by
+    # (listing, aspect, date) with running totals for date-window queries;
+    # inv_* arrays list the agg rows of each aspect best first / worst first.
+    # Strings are dictionary encoded, so every array is numeric and can be
+    # memory-mapped from disk.
+    ARRAYS = [
+        'listing_ids', 'offsets', 'bottom_order',
+        'agg_aspect', 'agg_score', 'agg_positive', 'agg_neutral', 'agg_negative', 'agg_total_mentions',
+        'row_offsets',
+        'tl_offsets', 'tl_date', 'tl_count', 'tl_score',
+        'win_key', 'win_score', 'win_positive', 'win_neutral', 'win_negative', 'win_total_mentions',
+        'inv_offsets', 'inv_top', 'inv_bottom'
+    ]
+    
+    def __init__(self, arrays, aspects, dates):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.aspects = list(aspects)
+        self.dates = list(dates)
+        self._positions = {lid: i for i, lid in enumerate(self.listing_ids.tolist())}
+        self._aspect_codes = {aspect: i for i, aspect in enumerate(self.aspects)}
+    
+    @classmethod
+    def from_frame(cls, frame, aspects=None):
+        # aspects: shared dictionary (sorted) to encode against; default: the frame's own aspects
+        import pandas as pd
+        
+        listing = frame['listing_id'].to_numpy(dtype=np.int64)
+        if aspects is None:
+            aspect_codes, aspects = pd.factorize(frame['aspect'], sort=True)
+        else:
+            aspect_codes = pd.Categorical(frame['aspect'], categories=aspects).codes.astype(np.int64)
+            if len(aspect_codes) and aspect_codes.min() < 0:
+                raise ValueError("aspect missing from the shared dictionary")
+        if 'date' in frame.columns:
+            date_codes, dates = pd.factorize(frame['date'].astype(str), sort=True)
+        else:
+            date_codes, dates = np.zeros(len(frame), dtype=np.int64), []
+        
+        arrays = {}
+        
+        # Raw rows, sorted by listing then date; only needed to build the timeline
+        row_order = np.lexsort((date_codes, listing))
+        row_listing = listing[row_order]
+        row_date = date_codes[row_order]
+        row_score = frame['score'].to_numpy(dtype=np.float64)[row_order]
+        _, row_starts = np.unique(row_listing, return_index=True)
+        arrays['row_offsets'] = np.append(row_starts, len(row_order))
+        
+        # Daily timeline: one entry per (listing, date) run of the sorted rows
+        new_day = np.ones(len(row_order), dtype=bool)
+        new_day[1:] = (row_listing[1:] != row_listing[:-1]) | (row_date[1:] != row_date[:-1])
+        day_starts = np.flatnonzero(new_day)
+        arrays['tl_date'] = row_date[day_starts]
+        arrays['tl_count'] = np.diff(np.append(day_starts, len(row_order)))
+        arrays['tl_score'] = np.add.reduceat(row_score, day_starts) if len(day_starts) else np.zeros(0)
+        arrays['tl_offsets'] = np.searchsorted(day_starts, arrays['row_offsets'])
+        
+        # Window prefix sums: same per-listing ranges as row_offsets, but sorted by aspect then
+        # date under the key aspect * n_dates + date. win_<col>[i] is the total of the rows
+        # before i, so the rows [lo, hi) sum to win_<col>[hi] - win_<col>[lo].
+        win_order = np.lexsort((date_codes, aspect_codes, listing))
+        arrays['win_key'] = aspect_codes[win_order] * max(len(dates), 1) + date_codes[win_order]
+        for col in AGG_COLUMNS:
+            dtype = np.float64 if col == 'score' else np.int64
+            arrays[f'win_{col}'] = np.concatenate(([0], np.cumsum(frame[col].to_numpy(dtype=dtype)[win_order]))).astype(dtype)
+        
+        # Aspect totals per listing; aspect codes follow alphabetical order
+        agg = pd.DataFrame({'listing_id': listing, 'aspect': aspect_codes})
+        for col in AGG_COLUMNS:
+            agg[col] = frame[col].to_numpy()
+        agg = agg.groupby(['listing_id', 'aspect'], sort=True)[AGG_COLUMNS].sum().reset_index()
+        
+        agg_listing = agg['listing_id'].to_numpy(dtype=np.int64)
+        score = agg['score'].to_numpy(dtype=np.float64)
+        
+        # lexsort is stable, so equal scores keep the alphabetical aspect order
+        top_order = np.lexsort((-score, agg_listing))
+        bottom_order = np.lexsort((score, agg_listing))
+        
+        arrays['agg_aspect'] = agg['aspect'].to_numpy(dtype=np.int64)[top_order]
+        arrays['agg_score'] = score[top_order]
+        for col in AGG_COLUMNS[1:]:
+            arrays[f'agg_{col}'] = agg[col].to_numpy(dtype=np.int64)[top_order]
+        
+        # Position of each bottom-ordered row within the top-ordered arrays
+        rank = np.empty_like(top_order)
+        rank[top_order] = np.arange(len(top_order))
+        arrays['bottom_order'] = rank[bottom_order]
+        
+        listing_ids, starts = np.unique(agg_listing[top_order], return_index=True)
+        arrays['listing_ids'] = listing_ids
+        arrays['offsets'] = np.append(starts, len(top_order))
+        
+        # Inverted index: agg rows grouped by aspect, ordered by score (desc / asc), then
+        # by mentions (more first) and listing id
+        inv_listing = agg_listing[top_order]
+        mentions = arrays['agg_total_mentions']
+        arrays['inv_top'] = np.lexsort((inv_listing, -mentions, -arrays['agg_score'], arrays['agg_aspect']))
+        arrays['inv_bottom'] = np.lexsort((inv_listing, -mentions, arrays['agg_score'], arrays['agg_aspect']))
+        arrays['inv_offsets'] = np.searchsorted(arrays['agg_aspect'][arrays['inv_top']], np.arange(len(aspects) + 1))
+        
+        arrays = {name: _compact(name, array, len(aspects), len(dates)) for name, array in arrays.items()}
+        return cls(arrays, aspects, dates)
+    
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('format') != ARTIFACT_FORMAT:
+            raise ValueError(f"Unsupported artifact format {meta.get('format')} in {path}")
+        
+        # Plain ndarray views over the maps: same shared pages, without np.memmap's per-op overhead
+        arrays = {name: np.asarray(np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')) for name in cls.ARRAYS}
+        return cls(arrays, meta['aspects'], meta['dates'])
+    
+    def save(self, path, source=None):
+        tmp_path = f'{path}.tmp-{os.getpid()}'
+        os.makedirs(tmp_path)
+        
+        for name in self.ARRAYS:
+            np.save(os.path.join(tmp_path, f'{name}.npy'), np.ascontiguousarray(getattr(self, name)))
+        
+        meta = {
+            'format': ARTIFACT_FORMAT,
+            'n_rows': self.n_rows,
+            'n_listings': len(self),
+            'aspects': self.aspects,
+            'dates': self.dates,
+            'source_mtime': os.path.getmtime(source) if source else None
+        }
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        
+        # Swap the directory in place so readers never see a half-written artifact
+        old_path = f'{path}.old-{os.getpid()}'
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+    
+    def use_aspects(self, aspects):
+        # Switches to a shared, sorted aspect dictionary. Indexes exported with that
+        # dictionary just adopt the list; others are re-coded (arrays move to the heap).
+        if list(aspects) == self.aspects:
+            self.aspects = aspects
+            return
+        
+        mapping = np.array([aspects.index(aspect) for aspect in self.aspects], dtype=np.int64)
+        n_dates = max(len(self.dates), 1)
+        key = self.win_key.astype(np.int64)
+        self.win_key = _compact('win_key', mapping[key // n_dates] * n_dates + key % n_dates, len(aspects), len(self.dates))
+        self.agg_aspect = _compact('agg_aspect', mapping[self.agg_aspect], len(aspects), len(self.dates))
+        sizes = np.zeros(len(aspects), dtype=np.int64)
+        sizes[mapping] = np.diff(self.inv_offsets)
+        self.inv_offsets = _compact('inv_offsets', np.concatenate(([0], np.cumsum(sizes))), len(aspects), len(self.dates))
+        self.aspects = aspects
+        self._aspect_codes = {aspect: i for i, aspect in enumerate(aspects)}
+    
+    def __len__(self):
+        return len(self.listing_ids)
+    
+    def __contains__(self, listing_id):
+        return listing_id in self._positions
+    
+    @property
+    def n_rows(self):
+        return len(self.win_key)
+    
+    def validate(self):
+        if len(self) == 0:
+            raise ValueError("no listings")
+        if not self.aspects:
+            raise ValueError("no aspects")
+        if len(self.offsets) != len(self) + 1 or int(self.offsets[-1]) != len(self.agg_aspect):
+            raise ValueError("aggregate offsets do not match aggregate rows")
+        if len(self.row_offsets) != len(self) + 1 or int(self.row_offsets[-1]) != self.n_rows:
+            raise ValueError("row offsets do not match rows")
+        if np.any(np.diff(self.listing_ids) <= 0) or np.any(np.diff(self.offsets) <= 0):
+            raise ValueError("listing ids or offsets are not strictly increasing")
+        if len(self.agg_aspect) and int(self.agg_aspect.max()) >= len(self.aspects):
+            raise ValueError("aspect code out of range")
+        if len(self.win_key) != self.n_rows or any(len(getattr(self, f'win_{col}')) != self.n_rows + 1 for col in AGG_COLUMNS):
+            raise ValueError("window arrays do not match rows")
+        if len(self.inv_offsets) != len(self.aspects) + 1 or len(self.inv_top) != len(self.agg_aspect):
+            raise ValueError("inverted index does not match aggregate rows")
+    
+    def memory_usage(self):
+        # Bytes held on the heap vs. bytes mapped from (shared) artifact files
+        usage = {'heap_bytes': 0, 'mapped_bytes': 0}
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            usage['mapped_bytes' if _is_mapped(array) else 'heap_bytes'] += int(array.nbytes)
+        return usage
+    
+    def lookup(self, listing_id, top_k=3):
+        pos = self._positions.get(listing_id)
+        if pos is None:
+            return None
+        
+        start, end = int(self.offsets[pos]), int(self.offsets[pos + 1])
+        top_rows = np.arange(start, end)[:top_k]
+        bottom_rows = self.bottom_order[start:end][:top_k]
+        
+        return self._format_rows(top_rows), self._format_rows(bottom_rows)
+    
+    def lookup_many(self, listing_ids, top_k=3):
+        # Same as lookup() for many listings: one gather per column for the whole batch
+        positions = [self._positions.get(lid) for lid in listing_ids]
+        found = [i for i, pos in enumerate(positions) if pos is not None]
+        results = [None] * len(listing_ids)
+        if not found:
+            return results
+        
+        pos = np.array([positions[i] for i in found], dtype=np.int64)
+        starts = self.offsets[pos]
+        sizes = self.offsets[pos + 1] - starts
+        k = np.minimum(sizes, top_k) if top_k >= 0 else np.maximum(sizes + top_k, 0)
+        
+        # Concatenated ranges starts[i] .. starts[i] + k[i]
+        bounds = np.cumsum(k)
+        top_rows = np.repeat(starts - (bounds - k), k) + np.arange(bounds[-1])
+        bottom_rows = self.bottom_order[top_rows]
+        
+        top = self._format_rows(top_rows)
+        bottom = self._format_rows(bottom_rows)
+        for i, end, n in zip(found, bounds.tolist(), k.tolist()):
+            results[i] = (top[end - n:end], bottom[end - n:end])
+        return results
+    
+    def lookup_window(self, listing_id, top_k=3, date_from=None, date_to=None):
+        # Aggregates over date_from <= date <= date_to (ISO dates, either may be None): two
+        # binary searches per aspect within the listing's rows, then prefix sum differences
+        pos = self._positions.get(listing_id)
+        if pos is None or not self.dates:
+            return None
+        
+        first = bisect_left(self.dates, date_from) if date_from else 0
+        end = bisect_right(self.dates, date_to) if date_to else len(self.dates)
+        start, stop = int(self.row_offsets[pos]), int(self.row_offsets[pos + 1])
+        keys = self.win_key[start:stop]
+        
+        aspects = np.sort(self.agg_aspect[self.offsets[pos]:self.offsets[pos + 1]]).astype(np.int64)
+        lo = start + np.searchsorted(keys, aspects * len(self.dates) + first)
+        hi = start + np.searchsorted(keys, aspects * len(self.dates) + max(end, first))
+        found = hi > lo
+        aspects, lo, hi = aspects[found], lo[found], hi[found]
+        
+        totals = [getattr(self, f'win_{col}')[hi] - getattr(self, f'win_{col}')[lo] for col in AGG_COLUMNS]
+        score = totals[0]
+        # Aspects are sorted by code (alphabetical), so lexsort breaks score ties like lookup()
+        top_rows = np.lexsort((aspects, -score))[:top_k]
+        bottom_rows = np.lexsort((aspects, score))[:top_k]
+        
+        return (self._format_columns(aspects[top_rows], *(t[top_rows] for t in totals)),
+                self._format_columns(aspects[bottom_rows], *(t[bottom_rows] for t in totals)))
+    
+    def top_listings(self, aspect, limit=50, offset=0, min_mentions=0, worst=False):
+        # (total, page) of listings ranked by their aggregate for one aspect
+        code = self._aspect_codes.get(aspect)
+        # The shared dictionary can hold aspects this variant never produced
+        if code is None or self.inv_offsets[code] == self.inv_offsets[code + 1]:
+            return None
+        
+        rows = (self.inv_bottom if worst else self.inv_top)[self.inv_offsets[code]:self.inv_offsets[code + 1]]
+        if min_mentions > 0:
+            rows = rows[self.agg_total_mentions[rows] >= min_mentions]
+        total = len(rows)
+        
+        rows = rows[offset:offset + limit]
+        listing_ids = self.listing_ids[np.searchsorted(self.offsets, rows, side='right') - 1].tolist()
+        return total, [{'listing_id': lid, **row} for lid, row in zip(listing_ids, self._format_rows(rows))]
+    
+    def timeline(self, listing_id):
+        pos = self._positions.get(listing_id)
+        if pos is None or not self.dates:
+            return None
+        
+        start, end = int(self.tl_offsets[pos]), int(self.tl_offsets[pos + 1])
+        return {
+            'dates': [self.dates[c] for c in self.tl_date[start:end].tolist()],
+            'counts': self.tl_count[start:end].tolist(),
+            'scores': self.tl_score[start:end].tolist()
+        }
+    
+    def _format_rows(self, rows):
+        return self._format_columns(
+            self.agg_aspect[rows],
+            self.agg_score[rows],
+            self.agg_positive[rows],
+            self.agg_neutral[rows],
+            self.agg_negative[rows],
+            self.agg_total_mentions[rows]
+        )
+    
+    def _format_columns(self, aspect, score, positive, neutral, negative, total_mentions):
+        columns = zip(
+            aspect.tolist(),
+            score.tolist(),
+            positive.tolist(),
+            neutral.tolist(),
+            negative.tolist(),
+            total_mentions.tolist()
+        )
+        return [{
+            'aspect': self.aspects[aspect],
+            'score': float(score),
+            'positive': int(positive),
+            'neutral': int(neutral),
+            'negative': int(negative),
+            'total_mentions': int(total_mentions)
+        } for aspect, score, positive, neutral, negative, total_mentions in columns]
+
+
+def _code_dtype(size):
+    return np.uint16 if size <= np.iinfo(np.uint16).max + 1 else np.int32
+
+
+def _compact(name, array, n_aspects, n_dates):
+    # Narrowest dtype that holds the values: uint16 dictionary codes, float32 scores,
+    # int32 ids / counts / offsets (int64 only where the values need it)
+    if name == 'agg_aspect':
+        return array.astype(_code_dtype(n_aspects))
+    if name == 'tl_date':
+        return array.astype(_code_dtype(n_dates))
+    if name == 'win_score':
+        # Running totals of integral scores are stored as integers; fractional ones keep float64
+        if not np.array_equal(array, np.round(array)):
+            return array
+    elif name.endswith('_score'):
+        return array.astype(np.float32)
+    bound = max(abs(int(array.min())), abs(int(array.max()))) if len(array) else 0
+    return array.astype(np.int32 if bound <= np.iinfo(np.int32).max else np.int64)
+
+
+def _is_mapped(array):
+    base = array
+    while base is not None:
+        if isinstance(base, mmap.mmap):
+            return True
+        base = getattr(base, 'base', None)
+    return False
+
+
+def source_fingerprint(data_dir, name):
+    # Files load_index() may read, with their mtime and size
+    paths = [os.path.join(data_dir, f'{name}.csv'), os.path.join(data_dir, name, 'meta.json')]
+    return [(p, os.path.getmtime(p), os.path.getsize(p)) for p in paths if os.path.exists(p)]
+
+
+def load_manifest(data_dir):
+    # Variants to serve from <data_dir>/variants.json, with their share of new listings:
+    #   {"variants": [{"name": "A", "model": "model_baseline", "weight": 45},
+    #                 {"name": "B", "model": "model_advanced2", "weight": 45},
+    #                 {"name": "C", "model": "model_candidate", "weight": 10}]}
+    # Without the file: A and B from MODEL_FILES, 50/50.
+    path = os.path.join(data_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return [{'name': variant, 'model': name, 'weight': 1.0} for variant, name in MODEL_FILES.items()]
+    
+    with open(path) as f:
+        entries = json.load(f)['variants']
+    variants = []
+    for entry in entries:
+        name, model, weight = str(entry['name']), str(entry['model']), float(entry.get('weight', 1.0))
+        if not name or name == 'unknown' or any(v['name'] == name for v in variants):
+            raise ValueError(f"Invalid or duplicate variant name {name!r} in {path}")
+        if weight < 0:
+            raise ValueError(f"Negative weight for variant {name} in {path}")
+        variants.append({'name': name, 'model': model, 'weight': weight})
+    if sum(v['weight'] for v in variants) <= 0:
+        raise ValueError(f"{path} needs at least one variant with a positive weight")
+    return variants
+
+
+def variants_fingerprint(data_dir, variants):
+    path = os.path.join(data_dir, MANIFEST_FILE)
+    manifest = [(path, os.path.getmtime(path), os.path.getsize(path))] if os.path.exists(path) else []
+    return [manifest] + [source_fingerprint(data_dir, v['model']) for v in variants]
+
+
+def load_index(data_dir, name):
+    # Prefer the memory-mapped export (see export_artifacts.py); fall back to CSV
+    csv_path = os.path.join(data_dir, f'{name}.csv')
+    bin_path = os.path.join(data_dir, name)
+    
+    if os.path.exists(os.path.join(bin_path, 'meta.json')):
+        stale = os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(os.path.join(bin_path, 'meta.json'))
+        if not stale:
+            try:
+                return ListingIndex.load(bin_path), bin_path
+            except ValueError as e:
+                logger.warning(f"{e}, loading CSV (re-run export_artifacts.py)")
+        else:
+            logger.warning(f"{bin_path} is older than {csv_path}, loading CSV (re-run export_artifacts.py)")
+    
+    if os.path.exists(csv_path):
+        import pandas as pd
+        
+        frame = pd.read_csv(csv_path)
+        frame['listing_id'] = frame['listing_id'].astype(int)
+        return ListingIndex.from_frame(frame), csv_path
+    
+    return None, csv_path
+
+
+class ModelSnapshot:
+    # Immutable set of loaded variants. Requests read ModelManager.snapshot once
+    # and keep using it, so a reload never changes data under a running request.
+    def __init__(self, indexes, sources, fingerprint, load_seconds, weights=None, aspects=None):
+        self.indexes = indexes
+        self.sources = sources
+        self.weights = weights or {variant: 1.0 for variant in indexes}
+        self.aspects = aspects or []
+        self.version = hashlib.sha1(repr(fingerprint).encode()).hexdigest()[:12]
+        self.fingerprint = fingerprint
+        self.load_seconds = load_seconds
+        self.loaded_at = datetime.now().isoformat()
+    
+    def index(self, variant):
+        return self.indexes.get(variant)
+    
+    def allocation(self):
+        # (variant, weight) of the loaded variants that take new listings
+        return [(v, w) for v, w in self.weights.items() if w > 0 and self.indexes.get(v) is not None]
+    
+    def memory_usage(self):
+        usage = {'heap_bytes': 0, 'mapped_bytes': 0}
+        for index in self.indexes.values():
+            if index is not None:
+                for key, value in index.memory_usage().items():
+                    usage[key] += value
+        return usage
+
+
 class ModelManager:
-    def __init__(self, data_dir=None):
+    # load=False leaves loading to the caller (app.py runs load() in a background thread)
+    def __init__(self, data_dir=None, load=True):
         if data_dir is None:
             script_dir = os.path.dirname(os.path.abspath(__file__))
             data_dir = os.path.join(script_dir, '..', 'part1', 'artifacts', 'ab_test')
         
         self.data_dir = os.path.abspath(data_dir)
-        self.model_a = None
-        self.model_b = None
-        self._load_models()
+        self.snapshot = None
+        self.generation = 0
+        self.progress = {}
+        self.reloading = False
+        self.last_error = None
+        self._reload_lock = threading.Lock()
+        self._reload_callbacks = []
+        self._watcher = None
+        if load:
+            self.load()
     
-    def _load_models(self):
-        try:
-            model_a_path = os.path.join(self.data_dir, 'model_baseline.csv')
-            model_b_path = os.path.join(self.data_dir, 'model_advanced2.csv')
-            
-            if os.path.exists(model_a_path):
-                self.model_a = pd.read_csv(model_a_path)
-                self.model_a['listing_id'] = self.model_a['listing_id'].astype(int)
-                logger.info(f"Model A: {len(self.model_a)} records, {self.model_a['listing_id'].nunique()} listings")
-            else:
-                logger.error(f"Model A not found: {model_a_path}")
-            
-            if os.path.exists(model_b_path):
-                self.model_b = pd.read_csv(model_b_path)
-                self.model_b['listing_id'] = self.model_b['listing_id'].astype(int)
-                logger.info(f"Model B: {len(self.model_b)} records, {self.model_b['listing_id'].nunique()} listings")
+    @property
+    def index_a(self):
+        return self.snapshot.index('A') if self.snapshot else None
+    
+    @property
+    def index_b(self):
+        return self.snapshot.index('B') if self.snapshot else None
+    
+    @property
+    def version(self):
+        return self.snapshot.version if self.snapshot else None
+    
+    @property
+    def variants(self):
+        return list(self.snapshot.indexes) if self.snapshot else []
+    
+    def allocation(self):
+        return self.snapshot.allocation() if self.snapshot else []
+    
+    def available_variants(self):
+        # Loaded variants, including weight 0 ones that keep serving their existing listings
+        if self.snapshot is None:
+            return []
+        return [variant for variant, index in self.snapshot.indexes.items() if index is not None]
+    
+    def _build_snapshot(self, validate=False):
+        start = time.time()
+        variants = load_manifest(self.data_dir)
+        fingerprint = variants_fingerprint(self.data_dir, variants)
+        self.progress = {v['name']: 'pending' for v in variants}
+        indexes, sources = {}, {}
+        
+        for entry in variants:
+            variant = entry['name']
+            self.progress[variant] = 'loading'
+            index, path = load_index(self.data_dir, entry['model'])
+            self.progress[variant] = 'loaded' if index is not None else 'missing'
+            if index is not None:
+                if validate:
+                    try:
+                        index.validate()
+                    except ValueError as e:
+                        raise ValueError(f"Model {variant} ({path}) failed validation: {e}")
+                logger.info(f"Model {variant}: {index.n_rows} records, {len(index)} listings ({path})")
+            elif validate:
+                raise ValueError(f"Model {variant} not found: {path}")
             else:
-                logger.error(f"Model B not found: {model_b_path}")
-                
+                logger.error(f"Model {variant} not found: {path}")
+            indexes[variant] = index
+            sources[variant] = path
+        
+        # One aspect dictionary for all variants, so codes mean the same everywhere
+        loaded = [index for index in indexes.values() if index is not None]
+        aspects = sorted(set().union(*(index.aspects for index in loaded)))
+        for index in loaded:
+            index.use_aspects(aspects)
+        
+        weights = {v['name']: v['weight'] for v in variants}
+        return ModelSnapshot(indexes, sources, fingerprint, time.time() - start, weights, aspects)
+    
+    def load(self):
+        try:
+            self.snapshot = self._build_snapshot()
+            self.generation = 1
+        
         except Exception as e:
             logger.error(f"Error loading models: {str(e)}")
             raise
     
+    def reload(self):
+        # Builds and validates a new snapshot while the old one keeps serving, then swaps it in
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        
+        try:
+            self.reloading = True
+            snapshot = self._build_snapshot(validate=True)
+            self.snapshot = snapshot
+            self.generation += 1
+            self.last_error = None
+            logger.info(f"Models reloaded: version {snapshot.version} in {snapshot.load_seconds:.2f}s")
+            
+            for callback in self._reload_callbacks:
+                try:
+                    callback(snapshot)
+                except Exception as e:
+                    logger.error(f"Reload callback error: {str(e)}")
+            return True
+        
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Model reload failed, keeping version {self.version}: {str(e)}")
+            return False
+        
+        finally:
+            self.reloading = False
+            self._reload_lock.release()
+    
+    def reload_async(self):
+        if self.reloading:
+            return False
+        threading.Thread(target=self.reload, name='model-reload', daemon=True).start()
+        return True
+    
+    def on_reload(self, callback):
+        self._reload_callbacks.append(callback)
+    
+    def start_watcher(self, interval=30.0):
+        # Polls the artifact files and reloads when any of them changes
+        if self._watcher is not None:
+            return
+        
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    fingerprint = variants_fingerprint(self.data_dir, load_manifest(self.data_dir))
+                    if self.snapshot is None or fingerprint != self.snapshot.fingerprint:
+                        logger.info("Model artifacts changed, reloading")
+                        self.reload()
+                except Exception as e:
+                    logger.error(f"Model watcher error: {str(e)}")
+        
+        self._watcher = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+    
+    def get_status(self):
+        snapshot = self.snapshot
+        status = {
+            "loaded": self.is_loaded(),
+            "generation": self.generation,
+            "reloading": self.reloading,
+            "watching": self._watcher is not None,
+            "last_error": self.last_error,
+            "rss_bytes": _rss_bytes()
+        }
+        if snapshot is not None:
+            status.update({
+                "version": snapshot.version,
+                "loaded_at": snapshot.loaded_at,
+                "load_seconds": round(snapshot.load_seconds, 4),
+                "memory": snapshot.memory_usage(),
+                "aspects": len(snapshot.aspects),
+                "models": {
+                    variant: {
+                        "source": snapshot.sources[variant],
+                        "weight": snapshot.weights.get(variant),
+                        "records": index.n_rows,
+                        "listings": len(index)
+                    } if index is not None else None
+                    for variant, index in snapshot.indexes.items()
+                }
+            })
+        return status
+    
     def is_loaded(self):
-        return self.model_a is not None and self.model_b is not None
+        snapshot = self.snapshot
+        return snapshot is not None and all(index is not None for index in snapshot.indexes.values())
     
-    def predict(self, listing_id, top_k=3, variant='A'):
+    def predict(self, listing_id, top_k=3, variant='A', date_from=None, date_to=None):
         try:
             listing_id = int(listing_id)
-            model_data = self.model_a if variant == 'A' else self.model_b
+            index = self.snapshot.index(variant)
             
-            if model_data is None:
+            if index is None:
                 return None
             
-            listing_data = model_data[model_data['listing_id'] == listing_id]
-            if listing_data.empty:
+            if date_from or date_to:
+                found = index.lookup_window(listing_id, int(top_k), date_from, date_to)
+            else:
+                found = index.lookup(listing_id, int(top_k))
+            if found is None:
                 return None
             
-            # Group by aspect and aggregate
-            aspect_scores = listing_data.groupby('aspect').agg({
-                'score': 'sum',
-                'positive': 'sum',
-                'neutral': 'sum',
-                'negative': 'sum',
-                'total_mentions': 'sum'
-            }).reset_index()
-            
-            top_aspects = aspect_scores.sort_values('score', ascending=False).head(top_k).to_dict('records')
-            bottom_aspects = aspect_scores.sort_values('score', ascending=True).head(top_k).to_dict('records')
-            
+            top_aspects, bottom_aspects = found
             return {
-                'top_aspects': self._format_aspects(top_aspects),
-                'bottom_aspects': self._format_aspects(bottom_aspects),
+                'top_aspects': top_aspects,
+                'bottom_aspects': bottom_aspects,
                 'model_variant': variant
             }
-            
+        
         except Exception as e:
             logger.error(f"Prediction error: {str(e)}")
             return None
     
-    def _format_aspects(self, aspects):
-        return [{
-            'aspect': a['aspect'],
-            'score': float(a['score']),
-            'positive': int(a.get('positive', 0)),
-            'neutral': int(a.get('neutral', 0)),
-            'negative': int(a.get('negative', 0)),
-            'total_mentions': int(a['total_mentions'])
-        } for a in aspects]
+    def predict_batch(self, listing_ids, top_k=3, variant='A'):
+        try:
+            index = self.snapshot.index(variant)
+            if index is None:
+                return [None] * len(listing_ids)
+            
+            found = index.lookup_many([int(lid) for lid in listing_ids], int(top_k))
+            return [{
+                'top_aspects': f[0],
+                'bottom_aspects': f[1],
+                'model_variant': variant
+            } if f is not None else None for f in found]
+        
+        except Exception as e:
+            logger.error(f"Batch prediction error: {str(e)}")
+            return [None] * len(listing_ids)
+    
+    def top_listings(self, aspect, variant='A', limit=50, offset=0, min_mentions=0, worst=False):
+        try:
+            index = self.snapshot.index(variant)
+            if index is None:
+                return None
+            
+            found = index.top_listings(aspect, int(limit), int(offset), int(min_mentions), worst)
+            if found is None:
+                return None
+            
+            total, listings = found
+            return {
+                'aspect': aspect,
+                'model_variant': variant,
+                'order': 'worst' if worst else 'best',
+                'total': total,
+                'offset': int(offset),
+                'listings': listings
+            }
+        
+        except Exception as e:
+            logger.error(f"Leaderboard error: {str(e)}")
+            return None
+    
+    def get_aspects(self, variant='A'):
+        index = self.snapshot.index(variant) if self.snapshot else None
+        if index is None:
+            return []
+        return [aspect for aspect, n in zip(index.aspects, np.diff(index.inv_offsets).tolist()) if n]
     
     def get_available_listings(self, variant='A'):
-        model_data = self.model_a if variant == 'A' else self.model_b
-        return sorted(model_data['listing_id'].unique().tolist()) if model_data is not None else []
+        index = self.snapshot.index(variant) if self.snapshot else None
+        return index.listing_ids.tolist() if index is not None else []
     
     def get_timeline_data(self, listing_id):
         try:
             listing_id = int(listing_id)
+            snapshot = self.snapshot
             result = {
                 'baseline': {'dates': [], 'counts': [], 'scores': []},
                 'advanced': {'dates': [], 'counts': [], 'scores': []}
             }
             
-            if self.model_a is not None and 'date' in self.model_a.columns:
-                listing_data = self.model_a[self.model_a['listing_id'] == listing_id]
-                if not listing_data.empty:
-                    timeline = listing_data.groupby('date').agg({
-                        'aspect': 'count',
-                        'score': 'sum'
-                    }).reset_index().rename(columns={'aspect': 'count'}).sort_values('date')
-                    
-                    result['baseline']['dates'] = timeline['date'].tolist()
-                    result['baseline']['counts'] = timeline['count'].tolist()
-                    result['baseline']['scores'] = timeline['score'].tolist()
-            
-            if self.model_b is not None and 'date' in self.model_b.columns:
-                listing_data = self.model_b[self.model_b['listing_id'] == listing_id]
-                if not listing_data.empty:
-                    timeline = listing_data.groupby('date').agg({
-                        'aspect': 'count',
-                        'score': 'sum'
-                    }).reset_index().rename(columns={'aspect': 'count'}).sort_values('date')
-                    
-                    result['advanced']['dates'] = timeline['date'].tolist()
-                    result['advanced']['counts'] = timeline['count'].tolist()
-                    result['advanced']['scores'] = timeline['score'].tolist()
+            # 'baseline'/'advanced' (A/B, drawn by the chart) plus every served variant
+            result['variants'] = {}
+            for variant, index in snapshot.indexes.items():
+                timeline = index.timeline(listing_id) if index is not None else None
+                result['variants'][variant] = timeline or {'dates': [], 'counts': [], 'scores': []}
+            for key, variant in (('baseline', 'A'), ('advanced', 'B')):
+                if variant in result['variants']:
+                    result[key] = result['variants'][variant]
             
             return result
-            
+        
         except Exception as e:
             logger.error(f"Timeline error: {str(e)}")
             return {
                 'baseline': {'dates': [], 'counts': [], 'scores': []},
-                'advanced': {'dates': [], 'counts': [], 'scores': []}
+                'advanced': {'dates': [], 'counts': [], 'scores': []},
+                'variants': {}
             }
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
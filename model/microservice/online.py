@@ -0,0 +1,301 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from functools import reduce
+import numpy as np
+
+# Text cleaning, sentence split and VADER thresholds come from the offline pipeline, so online
+# results follow the same rules as the precomputed artifacts
+PART1_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'part1'))
+if PART1_DIR not in sys.path:
+    sys.path.append(PART1_DIR)
+from preprocess import review_sentences
+from sentiment import labels_from_compound
+
+logger = logging.getLogger(__name__)
+
+SENTIMENTS = ('positive', 'neutral', 'negative')
+
+
+class TTLCache:
+    # Bounded LRU whose entries also expire after ttl seconds
+    def __init__(self, max_entries=1024, ttl=3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._cache[key]
+            self.misses += 1
+            return None
+    
+    def put(self, key, value):
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.ttl, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+    
+    def __len__(self):
+        return len(self._cache)
+
+
+class BaselineAspects:
+    # TF-IDF + KMeans of the baseline model, saved with joblib as
+    # {'tfidf': TfidfVectorizer, 'kmeans': KMeans, 'cluster_to_aspect': {cluster: aspect or None}}
+    def __init__(self, path):
+        import joblib
+        
+        model = joblib.load(path)
+        self.tfidf = model['tfidf']
+        self.kmeans = model['kmeans']
+        self.cluster_to_aspect = {int(k): v for k, v in model['cluster_to_aspect'].items()}
+    
+    def assign(self, sentences):
+        clusters = self.kmeans.predict(self.tfidf.transform(sentences))
+        return [self.cluster_to_aspect.get(int(c)) for c in clusters]
+
+
+class EmbeddingAspects:
+    # Centroids + merge map of the advanced model (part1/aspect_model.py) and its sentence encoder
+    def __init__(self, root, version=None):
+        if version is None:
+            with open(os.path.join(root, 'CURRENT')) as f:
+                version = f.read().strip()
+        path = os.path.join(root, version)
+        with open(os.path.join(path, 'mapping.json')) as f:
+            mapping = json.load(f)
+        
+        self.version = version
+        self.centroids = np.load(os.path.join(path, 'centroids.npy')).astype(np.float32)
+        self._half_sq_norms = 0.5 * (self.centroids ** 2).sum(axis=1)
+        merge_map = {int(k): int(v) for k, v in mapping['merge_map'].items()}
+        aspect_map = {int(k): v for k, v in mapping['aspect_map'].items()}
+        self.cluster_to_aspect = {c: aspect_map.get(m) for c, m in merge_map.items()}
+        self.embedding_model = mapping['embedding_model']
+        self._encoder = None
+    
+    def assign(self, sentences):
+        if self._encoder is None:
+            from sentence_transformers import SentenceTransformer
+            self._encoder = SentenceTransformer(self.embedding_model)
+            self._encoder.max_seq_length = 128
+        
+        embeddings = self._encoder.encode(sentences, batch_size=64, normalize_embeddings=True)
+        clusters = np.argmax(np.asarray(embeddings, dtype=np.float32) @ self.centroids.T - self._half_sq_norms, axis=1)
+        return [self.cluster_to_aspect.get(int(c)) for c in clusters]
+
+
+class VaderSentiment:
+    def __init__(self):
+        from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+        self.analyzer = SentimentIntensityAnalyzer()
+    
+    def labels(self, sentences):
+        scores = [self.analyzer.polarity_scores(str(sentence))["compound"] for sentence in sentences]
+        return labels_from_compound(scores).tolist()
+
+
+def covered_listings(indexes):
+    # Listings that every variant has artifacts for; only these can never fall back to online inference
+    loaded = list(indexes.values())
+    if not loaded or any(index is None for index in loaded):
+        return np.empty(0, dtype=np.int64)
+    return reduce(np.intersect1d, (index.listing_ids for index in loaded)).astype(np.int64)
+
+
+class ReviewSource:
+    # Review texts of listings that some variant has no artifacts for, read from a local
+    # reviews.csv (listing_id, comments). The index is built in a background thread and swapped
+    # in whole, so requests never wait for a scan; a changed file triggers a rebuild and the
+    # previous index keeps serving until it is done.
+    def __init__(self, path, chunk_size=200000):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.version = 0
+        self._reviews = {}
+        self._mtime = None
+        self._skip = np.empty(0, dtype=np.int64)
+        self._pending = False
+        self._idle = threading.Event()
+        self._idle.set()
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._reviews)
+    
+    def get(self, listing_id):
+        if self._idle.is_set() and self._changed():
+            self.refresh()
+        return self._reviews.get(listing_id, [])
+    
+    def _changed(self):
+        try:
+            return bool(self.path) and os.path.getmtime(self.path) != self._mtime
+        except OSError:
+            return False
+    
+    def refresh(self, skip=None):
+        # skip: sorted listing ids to leave out (see covered_listings); None keeps the previous set
+        if not self.path:
+            return
+        with self._lock:
+            if skip is not None:
+                self._skip = skip
+            self._pending = True
+            if not self._idle.is_set():
+                return
+            self._idle.clear()
+        threading.Thread(target=self._run, name='online-reviews', daemon=True).start()
+    
+    def wait(self, timeout=None):
+        return self._idle.wait(timeout)
+    
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._idle.set()
+                    return
+                self._pending = False
+                skip = self._skip
+            try:
+                self._scan(skip)
+            except Exception as e:
+                logger.error(f"Review index error: {str(e)}")
+    
+    def _scan(self, skip):
+        import pandas as pd
+        
+        start = time.time()
+        # Taken before reading, so a change during the scan triggers another one
+        mtime = os.path.getmtime(self.path)
+        self._mtime = mtime
+        reviews = defaultdict(list)
+        for chunk in pd.read_csv(self.path, usecols=['listing_id', 'comments'], chunksize=self.chunk_size):
+            chunk = chunk.dropna()
+            listing_ids = chunk['listing_id'].astype('int64').to_numpy()
+            keep = ~np.isin(listing_ids, skip)
+            for listing_id, comments in zip(listing_ids[keep].tolist(), chunk['comments'].to_numpy()[keep].tolist()):
+                reviews[listing_id].append(comments)
+        self._reviews = dict(reviews)
+        self.version += 1
+        logger.info(f"Indexed reviews of {len(self._reviews)} listings without artifacts in {time.time() - start:.1f}s")
+
+
+class OnlineInference:
+    # Fallback for listings missing from model_*.csv: runs the offline steps (sentence split,
+    # aspect assignment, sentiment, aggregation) on the listing's reviews at request time.
+    # Sentiment is VADER for both variants; the advanced model's transformer is offline only.
+    def __init__(self, data_dir, reviews_file=None, max_entries=1024, ttl=3600.0):
+        model_root = os.path.normpath(os.path.join(data_dir, '..', 'aspect_model'))
+        self.paths = {
+            'A': os.path.join(model_root, 'baseline.joblib'),
+            'B': os.path.join(model_root, 'CURRENT')
+        }
+        self.reviews = ReviewSource(reviews_file)
+        self.cache = TTLCache(max_entries, ttl)
+        self._assigners = {}
+        self._sentiment = None
+        self._lock = threading.Lock()
+    
+    def refresh(self, snapshot):
+        # After a model load or reload: drop cached results, pick up new aspect model versions
+        # and re-index the reviews of listings the new snapshot does not cover in every variant
+        with self._lock:
+            self._assigners = {}
+        self.cache.clear()
+        self.reviews.refresh(covered_listings(snapshot.indexes))
+    
+    def available(self, variant):
+        return os.path.exists(self.paths.get(variant, ''))
+    
+    def _assigner(self, variant):
+        with self._lock:
+            if variant not in self._assigners:
+                if variant == 'A':
+                    self._assigners[variant] = BaselineAspects(self.paths['A'])
+                else:
+                    self._assigners[variant] = EmbeddingAspects(os.path.dirname(self.paths['B']))
+            if self._sentiment is None:
+                self._sentiment = VaderSentiment()
+            return self._assigners[variant]
+    
+    def predict(self, listing_id, top_k=3, variant='A', texts=None):
+        try:
+            listing_id = int(listing_id)
+            if not self.available(variant):
+                return None
+            
+            # Texts from the request are keyed by content, texts from the file by index version
+            digest = hashlib.sha1(json.dumps(texts).encode()).hexdigest() if texts else self.reviews.version
+            key = (variant, listing_id, digest)
+            ranking = self.cache.get(key)
+            if ranking is None:
+                if not texts:
+                    texts = self.reviews.get(listing_id)
+                ranking = self._rank(texts, variant)
+                if ranking is None:
+                    return None
+                self.cache.put(key, ranking)
+            
+            top, bottom = ranking
+            return {
+                'top_aspects': top[:int(top_k)],
+                'bottom_aspects': bottom[:int(top_k)],
+                'model_variant': variant,
+                'source': 'online'
+            }
+        
+        except Exception as e:
+            logger.error(f"Online inference error: {str(e)}")
+            return None
+    
+    def _rank(self, texts, variant):
+        sentences = review_sentences(texts or [])
+        if not sentences:
+            return None
+        
+        assigner = self._assigner(variant)
+        aspects = assigner.assign(sentences)
+        labels = self._sentiment.labels(sentences)
+        
+        counts = defaultdict(lambda: dict.fromkeys(SENTIMENTS, 0))
+        for aspect, label in zip(aspects, labels):
+            if aspect is not None:
+                counts[aspect][label] += 1
+        if not counts:
+            return None
+        
+        rows = [{
+            'aspect': aspect,
+            'score': float(c['positive'] - c['negative']),
+            'positive': c['positive'],
+            'neutral': c['neutral'],
+            'negative': c['negative'],
+            'total_mentions': c['positive'] + c['neutral'] + c['negative']
+        } for aspect, c in counts.items()]
+        
+        # Same order as the precomputed index: score, ties broken by aspect name
+        top = sorted(rows, key=lambda r: (-r['score'], r['aspect']))
+        bottom = sorted(rows, key=lambda r: (r['score'], r['aspect']))
+        return top, bottom
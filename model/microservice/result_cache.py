@@ -0,0 +1,98 @@
+import json
+import threading
+from collections import OrderedDict
+
+
+class _Flight:
+    # One computation in progress; concurrent callers for the same key wait on it
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    # LRU cache of computed results, bounded by entry count and by approximate
+    # size (length of the JSON encoding, or sizeof(value)). Concurrent misses for
+    # one key run the computation once (single flight); the other callers get its result.
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or _json_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self.bytes = 0
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+    
+    def get_or_compute(self, key, compute):
+        if self.max_entries <= 0:
+            return compute()
+        
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = self._inflight[key] = _Flight()
+                leader = True
+                self.misses += 1
+            else:
+                leader = False
+                self.coalesced += 1
+        
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        
+        try:
+            flight.value = compute()
+            self._put(key, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+    
+    def _put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._cache[key] = (value, size)
+            self.bytes += size
+            while self._cache and (len(self._cache) > self.max_entries or self.bytes > self.max_bytes):
+                _, (_, evicted_size) = self._cache.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+    
+    def discard(self, key):
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+    
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.bytes = 0
+    
+    def __len__(self):
+        return len(self._cache)
+
+
+def _json_size(value):
+    return len(json.dumps(value, default=str))
@@ -0,0 +1,69 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class Startup:
+    # Runs the slow loading steps (models, A/B log) in background threads so the
+    # process can bind its port and answer /health right away. A failed step is
+    # retried every retry_interval seconds instead of killing the process.
+    def __init__(self, retry_interval=10.0):
+        self.retry_interval = retry_interval
+        self.started_at = time.time()
+        self.finished_at = None
+        self.steps = OrderedDict()
+        self._fns = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+    
+    def add(self, name, fn):
+        self._fns[name] = fn
+        self.steps[name] = {'state': 'pending', 'attempts': 0, 'seconds': None, 'error': None}
+    
+    def start(self):
+        for name in self._fns:
+            threading.Thread(target=self._run, args=(name,), name=f'startup-{name}', daemon=True).start()
+        if not self._fns:
+            self._finish()
+    
+    def _run(self, name):
+        step = self.steps[name]
+        while True:
+            start = time.time()
+            step.update(state='loading', attempts=step['attempts'] + 1)
+            try:
+                self._fns[name]()
+                step.update(state='done', seconds=round(time.time() - start, 3), error=None)
+                logger.info(f"Startup step {name} done in {step['seconds']:.2f}s")
+                break
+            except Exception as e:
+                step.update(state='failed', error=str(e))
+                logger.error(f"Startup step {name} failed (attempt {step['attempts']}), retrying in {self.retry_interval}s: {str(e)}")
+                time.sleep(self.retry_interval)
+        
+        with self._lock:
+            if not self.ready and all(s['state'] == 'done' for s in self.steps.values()):
+                self._finish()
+    
+    def _finish(self):
+        self.finished_at = time.time()
+        self._ready.set()
+        logger.info(f"Ready in {self.finished_at - self.started_at:.2f}s")
+    
+    @property
+    def ready(self):
+        return self._ready.is_set()
+    
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+    
+    def status(self):
+        end = self.finished_at or time.time()
+        return {
+            'ready': self.ready,
+            'elapsed_seconds': round(end - self.started_at, 3),
+            'steps': {name: dict(step) for name, step in self.steps.items()}
+        }
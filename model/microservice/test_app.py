@@ -0,0 +1,67 @@
+import os
+import pytest
+
+REMOTE = {'REMOTE_ADDR': '10.0.0.5'}
+
+
+@pytest.fixture(scope='module')
+def service(tmp_path_factory):
+    # app.py loads in the background and writes ab_log.csv / ab_state.db to the working directory
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    try:
+        import app
+        assert app.startup.wait(60)
+        yield app
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def client(service):
+    return service.app.test_client()
+
+
+def test_admin_without_token_is_local_only(service, client, monkeypatch):
+    monkeypatch.setattr(service, 'ADMIN_TOKEN', None)
+    assert client.post('/admin/reload', environ_base=REMOTE).status_code == 403
+    assert client.get('/admin/models', environ_base=REMOTE).status_code == 403
+    assert client.get('/admin/models', headers={'X-Forwarded-For': '10.0.0.5'}).status_code == 403
+    assert client.get('/admin/models').status_code == 200
+
+
+def test_admin_with_token(service, client, monkeypatch):
+    monkeypatch.setattr(service, 'ADMIN_TOKEN', 'secret')
+    assert client.get('/admin/models').status_code == 403
+    assert client.get('/admin/models', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.get('/admin/models', headers={'X-Admin-Token': 'secret'}, environ_base=REMOTE).status_code == 200
+
+
+def test_profiles_without_token_is_local_only(service, client, monkeypatch):
+    monkeypatch.setattr(service, 'ADMIN_TOKEN', None)
+    assert client.get('/debug/profiles', environ_base=REMOTE).status_code == 403
+    assert client.get('/debug/profiles').status_code in (200, 404)
+
+
+@pytest.mark.parametrize('query', ['limit=0', 'limit=-1', 'cursor=-1', 'limit=abc', 'format=ndjson&limit=-1'])
+def test_ab_log_rejects_bad_paging(client, query):
+    assert client.get(f'/ab_log?{query}').status_code == 400
+
+
+def test_ab_log_page(client):
+    response = client.get('/ab_log?limit=1&cursor=0')
+    assert response.status_code == 200
+    assert len(response.json['log']) <= 1
+
+
+@pytest.mark.parametrize('reviews', ['Great location', [1, 2], {'text': 'Clean'}, ['ok', None]])
+def test_predict_rejects_malformed_reviews(client, reviews):
+    response = client.post('/predict', json={'listing_id': 123, 'reviews': reviews})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('window', [{'from': '2024-01-01garbage'}, {'to': '2024-13-01'}, {'from': 20240101},
+                                    {'from': '2024-02-01', 'to': '2024-01-01'}])
+def test_predict_rejects_bad_window(client, window):
+    response = client.post('/predict', json={'listing_id': 123, **window})
+    assert response.status_code == 400
@@ -0,0 +1,53 @@
+import csv
+from datetime import date, timedelta
+from log_sink import LogSink, LOG_COLUMNS
+
+
+def record(i):
+    return {'timestamp': f'2024-01-01T00:00:{i:06d}', 'listing_id': i, 'variant': 'AB'[i % 2],
+            'top_aspects': '["cleanliness"]', 'bottom_aspects': '["noise"]', 'top_scores': '[1.0]', 'bottom_scores': '[-1.0]'}
+
+
+def read_segments(sink):
+    rows = []
+    for path in sink.segments():
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            assert reader.fieldnames == LOG_COLUMNS
+            rows.extend(reader)
+    return rows
+
+
+def test_close_drains_queue_across_rotations(tmp_path):
+    # Nothing is flushed by time; every row reaches disk through batches and close()
+    sink = LogSink(str(tmp_path / 'ab_log.csv'), batch_size=16, flush_interval=60, rotate_bytes=2000)
+    for i in range(150):
+        sink.write(record(i))
+    sink.write_many([record(i) for i in range(150, 300)])
+    sink.close()
+    
+    rows = read_segments(sink)
+    assert len(sink.segments()) > 2
+    assert [int(r['listing_id']) for r in rows] == list(range(300))
+    assert sink.written == 300 and sink.dropped == 0
+    assert not sink.write(record(300)) and sink.dropped == 1
+
+
+def test_flush_writes_pending_batch(tmp_path):
+    sink = LogSink(str(tmp_path / 'ab_log.csv'), batch_size=1000, flush_interval=0.05, fsync='batch')
+    sink.write_many([record(i) for i in range(5)])
+    sink.flush()
+    assert len(read_segments(sink)) == 5
+    sink.close()
+
+
+def test_daily_rotation(tmp_path):
+    sink = LogSink(str(tmp_path / 'ab_log.csv'), flush_interval=0.05, rotate_daily=True)
+    sink.write(record(0))
+    sink.flush()
+    sink._file_day = date.today() - timedelta(days=1)
+    sink.write(record(1))
+    sink.close()
+    
+    assert len(sink.segments()) == 2
+    assert [int(r['listing_id']) for r in read_segments(sink)] == [0, 1]
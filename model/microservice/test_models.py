@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+from models import ListingIndex, AGG_COLUMNS
+
+DATES = ['2024-01-01', '2024-01-05', '2024-02-10', '2024-03-01', '2024-03-02']
+
+
+@pytest.fixture(scope='module')
+def frame():
+    rng = np.random.default_rng(7)
+    n = 600
+    positive, neutral, negative = (rng.integers(0, 4, n) for _ in range(3))
+    return pd.DataFrame({
+        'listing_id': rng.integers(1, 8, n),
+        'aspect': rng.choice(['cleanliness', 'location', 'host', 'noise'], n),
+        'date': rng.choice(DATES, n),
+        'positive': positive,
+        'neutral': neutral,
+        'negative': negative,
+        'score': (positive - negative).astype(float),
+        'total_mentions': positive + neutral + negative
+    })
+
+
+def expected_window(frame, listing_id, date_from, date_to):
+    rows = frame[frame['listing_id'] == listing_id]
+    if date_from:
+        rows = rows[rows['date'] >= date_from]
+    if date_to:
+        rows = rows[rows['date'] <= date_to]
+    agg = rows.groupby('aspect')[AGG_COLUMNS].sum().reset_index()
+    top = agg.sort_values(['score', 'aspect'], ascending=[False, True])
+    bottom = agg.sort_values(['score', 'aspect'], ascending=[True, True])
+    return [[(r.aspect, r.score, r.positive, r.neutral, r.negative, r.total_mentions) for r in part.itertuples()]
+            for part in (top, bottom)]
+
+
+def as_tuples(rows):
+    return [(r['aspect'], r['score'], r['positive'], r['neutral'], r['negative'], r['total_mentions']) for r in rows]
+
+
+# Exact dates of the data, dates between and outside them, single-day and empty windows
+WINDOWS = [
+    ('2024-01-01', '2024-03-02'), ('2024-01-05', '2024-01-05'), ('2024-01-02', '2024-02-10'),
+    ('2024-01-06', '2024-02-09'), ('2023-12-01', '2024-01-01'), ('2024-03-02', '2025-01-01'),
+    ('2024-03-03', None), (None, '2023-12-31'), ('2024-02-10', None), (None, '2024-01-05')
+]
+
+
+@pytest.mark.parametrize('date_from, date_to', WINDOWS)
+def test_lookup_window_matches_pandas(frame, date_from, date_to):
+    index = ListingIndex.from_frame(frame)
+    for listing_id in sorted(frame['listing_id'].unique().tolist()):
+        top, bottom = index.lookup_window(listing_id, 10, date_from, date_to)
+        expected_top, expected_bottom = expected_window(frame, listing_id, date_from, date_to)
+        assert as_tuples(top) == expected_top
+        assert as_tuples(bottom) == expected_bottom
+
+
+def test_lookup_window_top_k_and_unknown_listing(frame):
+    index = ListingIndex.from_frame(frame)
+    top, bottom = index.lookup_window(1, 2, '2024-01-05', '2024-02-10')
+    expected_top, expected_bottom = expected_window(frame, 1, '2024-01-05', '2024-02-10')
+    assert as_tuples(top) == expected_top[:2] and as_tuples(bottom) == expected_bottom[:2]
+    assert index.lookup_window(999, 3, '2024-01-01', None) is None
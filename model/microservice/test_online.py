@@ -0,0 +1,52 @@
+import pandas as pd
+from models import ModelManager, MODEL_FILES
+from online import ReviewSource, covered_listings
+
+
+def write_model(data_dir, name, listings):
+    rows = [{'listing_id': listing_id, 'aspect': 'cleanliness', 'date': '2024-01-01', 'negative': 0, 'neutral': 0,
+             'positive': 1, 'score': 1.0, 'total_mentions': 1} for listing_id in listings]
+    pd.DataFrame(rows).to_csv(data_dir / f'{name}.csv', index=False)
+
+
+def write_reviews(path, listings):
+    rows = [{'listing_id': listing_id, 'comments': f'Review number {i} of listing {listing_id}.'}
+            for listing_id in listings for i in range(2)]
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def test_listing_missing_from_one_variant_keeps_its_reviews(tmp_path):
+    write_model(tmp_path, MODEL_FILES['A'], [1, 2, 3])
+    write_model(tmp_path, MODEL_FILES['B'], [1, 2])
+    manager = ModelManager(str(tmp_path))
+    assert covered_listings(manager.snapshot.indexes).tolist() == [1, 2]
+    
+    write_reviews(tmp_path / 'reviews.csv', [1, 3, 4])
+    source = ReviewSource(str(tmp_path / 'reviews.csv'))
+    source.refresh(covered_listings(manager.snapshot.indexes))
+    assert source.wait(10)
+    assert source.get(1) == []
+    assert len(source.get(3)) == 2
+    assert len(source.get(4)) == 2
+    
+    # A reload that drops listing 1 from A makes its reviews needed again
+    write_model(tmp_path, MODEL_FILES['A'], [2, 3])
+    manager.reload()
+    source.refresh(covered_listings(manager.snapshot.indexes))
+    assert source.wait(10)
+    assert len(source.get(1)) == 2 and len(source.get(3)) == 2
+
+
+def test_changed_file_is_reindexed_in_background(tmp_path):
+    path = tmp_path / 'reviews.csv'
+    write_reviews(path, [1])
+    source = ReviewSource(str(path))
+    source.refresh()
+    assert source.wait(10)
+    assert source.get(2) == []
+    
+    write_reviews(path, [1, 2])
+    source._mtime = None
+    source.get(2)
+    assert source.wait(10)
+    assert len(source.get(2)) == 2
@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from result_cache import ResultCache
+
+
+def test_concurrent_misses_compute_once():
+    cache = ResultCache()
+    calls = []
+    release = threading.Event()
+    
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {'value': 42}
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(cache.get_or_compute, 'key', compute) for _ in range(8)]
+        # Let every thread reach the cache before the leader finishes
+        deadline = time.monotonic() + 5
+        while cache.coalesced < 7 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        results = [f.result() for f in futures]
+    
+    assert len(calls) == 1
+    assert results == [{'value': 42}] * 8
+    assert cache.misses == 1 and cache.coalesced == 7
+    assert cache.get_or_compute('key', lambda: pytest.fail("cached value recomputed")) == {'value': 42}
+
+
+def test_error_reaches_waiters_and_is_not_cached():
+    cache = ResultCache()
+    release = threading.Event()
+    
+    def fail():
+        release.wait(5)
+        raise ValueError("boom")
+    
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(cache.get_or_compute, 'key', fail) for _ in range(4)]
+        deadline = time.monotonic() + 5
+        while cache.coalesced < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+    
+    assert len(cache) == 0
+    assert cache.get_or_compute('key', lambda: 'ok') == 'ok'
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = ResultCache(max_entries=2, max_bytes=100, sizeof=len)
+    cache.get_or_compute('a', lambda: 'x' * 10)
+    cache.get_or_compute('b', lambda: 'x' * 10)
+    cache.get_or_compute('a', lambda: pytest.fail("a evicted"))
+    cache.get_or_compute('c', lambda: 'x' * 10)
+    # b was least recently used
+    assert cache.evictions == 1 and len(cache) == 2
+    assert cache.get_or_compute('b', lambda: 'new') == 'new'
+    
+    cache.get_or_compute('big', lambda: 'x' * 98)
+    assert cache.bytes <= 100 and len(cache) == 1
+    cache.discard('big')
+    assert cache.bytes == 0 and len(cache) == 0
+
+
+def test_disabled_cache_always_computes():
+    cache = ResultCache(max_entries=0)
+    calls = []
+    for _ in range(3):
+        cache.get_or_compute('key', lambda: calls.append(1))
+    assert len(calls) == 3 and len(cache) == 0
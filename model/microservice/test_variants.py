@@ -0,0 +1,37 @@
+import json
+import pandas as pd
+from models import ModelManager, MODEL_FILES
+from ab_test import ABTestManager, hash_variant
+
+LISTINGS = range(1, 41)
+
+
+def write_model(data_dir, name):
+    rows = [{'listing_id': listing_id, 'aspect': aspect, 'date': '2024-01-01', 'negative': 1, 'neutral': 0,
+             'positive': 3, 'score': 2.0, 'total_mentions': 4}
+            for listing_id in LISTINGS for aspect in ('cleanliness', 'location')]
+    pd.DataFrame(rows).to_csv(data_dir / f'{name}.csv', index=False)
+
+
+def write_manifest(data_dir, variants):
+    manifest = {'variants': [{'name': v, 'model': MODEL_FILES[v], 'weight': 1} for v in variants]}
+    (data_dir / 'variants.json').write_text(json.dumps(manifest))
+
+
+def test_listing_of_dropped_variant_is_reassigned(tmp_path):
+    for name in MODEL_FILES.values():
+        write_model(tmp_path, name)
+    write_manifest(tmp_path, ['A', 'B'])
+    manager = ModelManager(str(tmp_path))
+    ab = ABTestManager(str(tmp_path / 'ab_log.csv'), str(tmp_path / 'ab_state.db'))
+
+    listing_id = next(l for l in LISTINGS if hash_variant(l) == 'B')
+    assert ab.assign_variant(listing_id, manager.allocation(), manager.available_variants()) == 'B'
+
+    write_manifest(tmp_path, ['A'])
+    manager.reload()
+    variant = ab.assign_variant(listing_id, manager.allocation(), manager.available_variants())
+    assert variant == 'A'
+    assert ab.assignments.get(listing_id) == 'A'
+    assert manager.predict(listing_id, 3, variant) is not None
+    ab.close()
@@ -0,0 +1,290 @@
+import argparse
+import os
+import csv
+import itertools
+import json
+import time
+import logging
+from collections import deque
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Persisted aspect model of the advanced variant: MiniBatchKMeans centroids (K=22) plus the
+# hand-made cluster merge map and aspect names from part2_modeling. New sentences are labeled by
+# nearest centroid and only the listings they belong to are updated in model_advanced2.csv.
+#   <root>/<version>/centroids.npy   float32, K x dim
+#   <root>/<version>/mapping.json    merge map, aspect names, embedding model
+#   <root>/CURRENT                   name of the version used by default
+
+DEFAULT_ROOT = os.path.join("artifacts", "aspect_model")
+SENTIMENTS = ["positive", "neutral", "negative"]
+
+CLUSTER_MERGE_MAP = {
+    0: 0, 1: 1, 2: 2, 5: 3, 6: 4, 7: 5, 8: 6, 9: 7, 10: 8, 11: 9, 12: 10,
+    13: 11, 14: 12, 15: 13, 16: 14, 17: 15, 19: 16, 20: 17, 21: 18, 3: 19,
+    4: -1, 18: -1,
+}
+
+# Baseline (TF-IDF + KMeans) clusters from part2_modeling_basic
+BASELINE_CLUSTER_TO_ASPECT = {
+    17: None,
+    3: "overall_positive",
+    4: "overall_positive",
+    10: "overall_positive",
+    13: "overall_positive",
+    15: "overall_positive",
+    20: "overall_positive",
+    21: "overall_positive",
+    8: "overall_positive",
+    
+    0: "cleanliness",
+    18: "cleanliness",
+    2: "dining_entertainment",
+    6: "walkability",
+    19: "walkability",
+    16: "transport_connectivity",
+    9: "location_close_center",
+    11: "apartment_capacity",
+    1: "apartment_appearance",
+    5: "atmosphere_ambiance",
+    7: "host_and_property",
+    14: "host_communication",
+    12: "arrival_check_in_experience",
+}
+
+CLUSTER_TO_ASPECT_FINAL = {
+    0: "overall_positive",
+    7: "overall_positive",
+    10: "overall_positive",
+    11: "overall_positive",
+    18: "overall_positive",
+    
+    1: "apartment_quality",
+    13: "apartment_quality",
+    4: "host_communication",
+    8: "host_communication",
+    9: "transport_proximity",
+    16: "transport_proximity",
+    2: "space_location_features",
+    3: "neighborhood_services",
+    5: "host_arrival_services",
+    6: "equipment_supplies",
+    12: "environmental_conditions",
+    14: "location_quality",
+    15: "apartment_amenities",
+    17: "infrastructure_accessibility",
+}
+
+
+class AspectModel:
+    def __init__(self, centroids, merge_map, aspect_map, embedding_model=None, version=None):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.merge_map = {int(k): int(v) for k, v in merge_map.items()}
+        self.aspect_map = {int(k): v for k, v in aspect_map.items()}
+        self.embedding_model = embedding_model
+        self.version = version
+        
+        # cluster id -> aspect index in self.aspects, -1 for dropped clusters
+        self.aspects = sorted(set(self.aspect_map.values()))
+        self._aspect_of_cluster = np.full(len(self.centroids), -1, dtype=np.int32)
+        for cluster, merged in self.merge_map.items():
+            aspect = self.aspect_map.get(merged)
+            if aspect is not None:
+                self._aspect_of_cluster[cluster] = self.aspects.index(aspect)
+        self._half_sq_norms = 0.5 * (self.centroids ** 2).sum(axis=1)
+    
+    def predict_clusters(self, embeddings, batch_size=65536):
+        # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2): one matrix product per batch
+        labels = np.empty(len(embeddings), dtype=np.int32)
+        for begin in range(0, len(embeddings), batch_size):
+            batch = np.asarray(embeddings[begin:begin + batch_size], dtype=np.float32)
+            labels[begin:begin + batch_size] = np.argmax(batch @ self.centroids.T - self._half_sq_norms, axis=1)
+        return labels
+    
+    def assign(self, embeddings, batch_size=65536):
+        # Aspect name per embedding, None where the cluster was dropped in the merge map
+        idx = self._aspect_of_cluster[self.predict_clusters(embeddings, batch_size)]
+        names = np.array(self.aspects + [None], dtype=object)
+        return names[idx]
+    
+    def save(self, root=DEFAULT_ROOT, version=None, make_current=True):
+        version = version or datetime.now().strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(root, version)
+        if os.path.exists(path):
+            raise FileExistsError(f"Aspect model version {version} already exists")
+        tmp_path = f'{path}.tmp'
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, 'centroids.npy'), self.centroids)
+        with open(os.path.join(tmp_path, 'mapping.json'), 'w') as f:
+            json.dump({
+                'version': version,
+                'created_at': datetime.now().isoformat(),
+                'embedding_model': self.embedding_model,
+                'n_clusters': len(self.centroids),
+                'dim': self.centroids.shape[1],
+                'merge_map': {str(k): v for k, v in self.merge_map.items()},
+                'aspect_map': {str(k): v for k, v in self.aspect_map.items()},
+            }, f, indent=2)
+        os.rename(tmp_path, path)
+        
+        if make_current:
+            with open(os.path.join(root, 'CURRENT.tmp'), 'w') as f:
+                f.write(version)
+            os.replace(os.path.join(root, 'CURRENT.tmp'), os.path.join(root, 'CURRENT'))
+        self.version = version
+        logger.info(f"Saved aspect model {path}")
+        return path
+    
+    @classmethod
+    def load(cls, root=DEFAULT_ROOT, version=None):
+        if version is None:
+            with open(os.path.join(root, 'CURRENT')) as f:
+                version = f.read().strip()
+        path = os.path.join(root, version)
+        with open(os.path.join(path, 'mapping.json')) as f:
+            mapping = json.load(f)
+        centroids = np.load(os.path.join(path, 'centroids.npy'))
+        return cls(centroids, mapping['merge_map'], mapping['aspect_map'], mapping.get('embedding_model'), version)
+
+
+def save_baseline_model(tfidf, kmeans, root=DEFAULT_ROOT, cluster_to_aspect=BASELINE_CLUSTER_TO_ASPECT):
+    # The fitted TfidfVectorizer + KMeans of part2_modeling_basic, in the form the
+    # microservice's online inference loads (<root>/baseline.joblib)
+    import joblib
+    
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, 'baseline.joblib')
+    joblib.dump({'tfidf': tfidf, 'kmeans': kmeans, 'cluster_to_aspect': cluster_to_aspect}, f'{path}.tmp')
+    os.replace(f'{path}.tmp', path)
+    logger.info(f"Saved baseline aspect model {path}")
+    return path
+
+
+def aggregate(sentences):
+    # Same pivot as part2_modeling: counts per (listing, aspect, date) and sentiment
+    counts = (
+        sentences.dropna(subset=["aspect"])
+        .groupby(["listing_id", "aspect", "date", "sentiment"])
+        .size()
+        .unstack("sentiment", fill_value=0)
+    )
+    for col in SENTIMENTS:
+        if col not in counts.columns:
+            counts[col] = 0
+    return counts[SENTIMENTS]
+
+
+def update_model_file(model_path, new_counts):
+    # Adds the new counts to model_advanced2.csv in one streaming pass over the file, which is sorted
+    # by listing_id (notebook pivot / build_artifacts.py). Lines of listings without new sentences are
+    # copied as they are; only the affected listings are re-aggregated and written, so memory depends
+    # on the update, not on the model. The file is still rewritten as a whole (CSV has no in-place update).
+    updates = {}
+    for (listing_id, aspect, date), counts in zip(new_counts.index, new_counts[SENTIMENTS].to_numpy().tolist()):
+        updates.setdefault(int(listing_id), {})[(str(aspect), str(date))] = dict(zip(SENTIMENTS, counts))
+    pending = deque(sorted(updates))
+    rewritten = 0
+    
+    tmp_path = f"{model_path}.tmp"
+    with open(model_path, encoding="utf-8", newline="") as src, \
+            open(tmp_path, "w", encoding="utf-8", newline="") as out:
+        header = src.readline()
+        columns = next(csv.reader([header]))
+        out.write(header)
+        writer = csv.DictWriter(out, columns, lineterminator="\n")
+        first = src.readline()
+        # Keep the file's score format (float from the notebook pivot, int from build_artifacts.py)
+        float_score = bool(first) and "." in next(csv.reader([first]))[columns.index("score")]
+        
+        def write_listing(listing_id, lines):
+            cells = {}
+            for row in csv.DictReader(lines, fieldnames=columns):
+                cells[(row["aspect"], row["date"])] = {col: int(float(row[col])) for col in SENTIMENTS}
+            for key, counts in updates[listing_id].items():
+                cell = cells.setdefault(key, dict.fromkeys(SENTIMENTS, 0))
+                for col in SENTIMENTS:
+                    cell[col] += counts[col]
+            for (aspect, date), cell in sorted(cells.items()):
+                score = cell["positive"] - cell["negative"]
+                writer.writerow({"listing_id": listing_id, "aspect": aspect, "date": date, **cell,
+                                 "score": float(score) if float_score else score,
+                                 "total_mentions": sum(cell.values())})
+            return len(cells)
+        
+        lines = (line if line.endswith("\n") else line + "\n" for line in itertools.chain([first], src) if line)
+        for listing_id, group in itertools.groupby(lines, key=lambda line: int(float(line.split(",", 1)[0]))):
+            # Listings new to the model go where their id sorts
+            while pending and pending[0] < listing_id:
+                rewritten += write_listing(pending.popleft(), [])
+            if pending and pending[0] == listing_id:
+                rewritten += write_listing(pending.popleft(), list(group))
+            else:
+                out.writelines(group)
+        while pending:
+            rewritten += write_listing(pending.popleft(), [])
+    
+    os.replace(tmp_path, model_path)
+    logger.info(f"Updated {model_path}: {len(updates)} listings, {rewritten} rows rewritten")
+    return rewritten
+
+
+def label_sentences(sentences_path, aspect_model, store, chunk_size=100000):
+    # Streams the sentences CSV (listing_id, sentence, date, sentiment), looks their embeddings
+    # up in the embedding store and returns the summed counts
+    from embedding_store import sentence_keys
+    
+    totals = None
+    labeled = 0
+    for chunk in pd.read_csv(sentences_path, chunksize=chunk_size):
+        chunk["aspect"] = aspect_model.assign(store.get(sentence_keys(chunk["sentence"].tolist())))
+        counts = aggregate(chunk)
+        totals = counts if totals is None else totals.add(counts, fill_value=0)
+        labeled += len(chunk)
+    if totals is None:
+        raise ValueError(f"No sentences in {sentences_path}")
+    logger.info(f"Labeled {labeled} sentences")
+    return totals.astype("int64")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persist the advanced aspect model / label new sentences with it")
+    sub = parser.add_subparsers(dest='command', required=True)
+    
+    save = sub.add_parser('save', help="store centroids of a fitted (MiniBatch)KMeans saved with joblib")
+    save.add_argument('--kmeans', required=True)
+    save.add_argument('--embedding-model', default='intfloat/multilingual-e5-base')
+    save.add_argument('--root', default=DEFAULT_ROOT)
+    save.add_argument('--version', default=None)
+    
+    update = sub.add_parser('update', help="label new sentences (already in the embedding store) "
+                                           "and add them to model_advanced2.csv")
+    update.add_argument('--sentences', required=True, help="CSV with listing_id, sentence, date, sentiment")
+    update.add_argument('--model-file', default=os.path.join('artifacts', 'ab_test', 'model_advanced2.csv'))
+    update.add_argument('--root', default=DEFAULT_ROOT)
+    update.add_argument('--version', default=None)
+    update.add_argument('--store', default=os.path.join('artifacts', 'embeddings'))
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'save':
+        import joblib
+        kmeans = joblib.load(args.kmeans)
+        AspectModel(kmeans.cluster_centers_, CLUSTER_MERGE_MAP, CLUSTER_TO_ASPECT_FINAL,
+                    args.embedding_model).save(args.root, args.version)
+        return
+    
+    from embedding_store import EmbeddingStore
+    
+    start = time.time()
+    aspect_model = AspectModel.load(args.root, args.version)
+    store = EmbeddingStore(args.store, aspect_model.embedding_model)
+    new_counts = label_sentences(args.sentences, aspect_model, store)
+    update_model_file(args.model_file, new_counts)
+    print(f"Done in {time.time() - start:.1f}s (aspect model {aspect_model.version})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import os
+import heapq
+import shutil
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+from aspect_model import aggregate, SENTIMENTS
+from preprocess import ShardedWriter
+
+logger = logging.getLogger(__name__)
+
+# Out-of-core version of the pivot cells in part2_modeling(_basic): streams a labeled sentences CSV
+# (listing_id, date, aspect, sentiment), pre-aggregates every chunk and hash-partitions the counts
+# by listing_id; partitions are aggregated on a process pool and merged into the sorted
+# ab_test/model_*.csv. Memory depends on the chunk and partition size, not on the corpus.
+
+KEY = ["listing_id", "aspect", "date"]
+OUTPUT_COLUMNS = ["listing_id", "aspect", "date", "negative", "neutral", "positive", "score", "total_mentions"]
+
+
+def partition_of(listing_ids, partitions):
+    return pd.util.hash_array(listing_ids.to_numpy()) % partitions
+
+
+def split_input(input_path, part_dir, partitions, chunk_size=500000):
+    # Phase 1: counts per (listing, aspect, date, sentiment) of each chunk, appended to partition files
+    writer = ShardedWriter()
+    total = 0
+    for chunk in pd.read_csv(input_path, usecols=KEY + ["sentiment"], chunksize=chunk_size):
+        total += len(chunk)
+        chunk = chunk.dropna(subset=["listing_id"])
+        chunk["listing_id"] = chunk["listing_id"].astype("int64")
+        counts = aggregate(chunk).reset_index()
+        for part, rows in counts.groupby(partition_of(counts["listing_id"], partitions), sort=False):
+            writer.append(os.path.join(part_dir, f"part_{part:04d}.csv"), rows)
+    logger.info(f"Split {total} sentences into {len(writer.rows)} partitions ({sum(writer.rows.values())} partial rows)")
+    return sorted(writer.rows)
+
+
+def aggregate_partition(path):
+    # Phase 2: final counts of one partition, sorted like the notebook pivot, written next to it
+    counts = pd.read_csv(path, dtype={"aspect": str, "date": str}).groupby(KEY, sort=True)[SENTIMENTS].sum().reset_index()
+    counts["score"] = counts["positive"] - counts["negative"]
+    counts["total_mentions"] = counts["positive"] + counts["neutral"] + counts["negative"]
+    out_path = f"{path[:-len('.csv')]}.agg.csv"
+    counts[OUTPUT_COLUMNS].to_csv(out_path, index=False)
+    return out_path, len(counts)
+
+
+def _sort_key(line):
+    listing_id, aspect, date, _ = line.split(",", 3)
+    return int(listing_id), aspect, date
+
+
+def merge_partitions(paths, output_path):
+    # Phase 3: k-way merge of the sorted partitions; one line per partition in memory
+    files = [open(path, encoding="utf-8", newline="") for path in paths]
+    try:
+        for f in files:
+            f.readline()
+        tmp_path = f"{output_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8", newline="") as out:
+            out.write(",".join(OUTPUT_COLUMNS) + "\n")
+            out.writelines(heapq.merge(*files, key=_sort_key))
+        os.replace(tmp_path, output_path)
+    finally:
+        for f in files:
+            f.close()
+
+
+def build(input_path, output_path, partitions=64, workers=None, chunk_size=500000, tmp_dir=None):
+    workers = workers or os.cpu_count() or 1
+    part_dir = tmp_dir or f"{output_path}.parts"
+    shutil.rmtree(part_dir, ignore_errors=True)
+    os.makedirs(part_dir)
+    start = time.time()
+    
+    try:
+        paths = split_input(input_path, part_dir, partitions, chunk_size)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(aggregate_partition, paths))
+        rows = sum(n for _, n in results)
+        merge_partitions([path for path, _ in results], output_path)
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+    
+    logger.info(f"Saved {output_path}: {rows} rows ({time.time() - start:.1f}s)")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an A/B model artifact (model_*.csv) from labeled sentences, out of core")
+    parser.add_argument('--input', default=os.path.join('artifacts', 'sentences_with_sentiment_all_top10_all_final_WITH_ASPECTS2.csv'),
+                        help="CSV with listing_id, date, aspect, sentiment")
+    parser.add_argument('--output', default=os.path.join('artifacts', 'ab_test', 'model_advanced2.csv'))
+    parser.add_argument('--partitions', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=None, help="default: number of cores")
+    parser.add_argument('--chunk-size', type=int, default=500000)
+    parser.add_argument('--tmp-dir', default=None, help="default: <output>.parts")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    build(args.input, args.output, args.partitions, args.workers, args.chunk_size, args.tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
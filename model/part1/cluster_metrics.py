@@ -0,0 +1,288 @@
+import argparse
+import os
+import json
+import time
+import logging
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Silhouette, Davies-Bouldin and Calinski-Harabasz over the full (memory-mapped) embedding matrix,
+# instead of the 100k sample part2_modeling scores with sklearn. Rows are processed in blocks on a
+# thread pool, so memory is bounded by workers * block_rows * block_cols, not by n^2.
+# Several labelings (e.g. one per K of a sweep) are scored together: their clusters are stacked into
+# one "super" one-hot, so every block of pairwise distances is computed once and reduced for all K.
+#   pass 1 (linear)    per-cluster sums and counts -> centroids, squared row norms
+#   pass 2 (linear)    distances to the own centroid -> Davies-Bouldin, Calinski-Harabasz
+#   pass 3 (quadratic) per-row sums of distances to every cluster -> exact silhouette
+
+BLOCK_ROWS = 2048
+BLOCK_COLS = 16384
+
+
+def _rows(embeddings, begin, end):
+    # float16 / mmap slices -> contiguous float32 block
+    return np.ascontiguousarray(embeddings[begin:end], dtype=np.float32)
+
+
+def _encode(labelings):
+    # n x L matrix of stacked cluster codes: labeling l uses columns offsets[l] .. offsets[l] + sizes[l]
+    codes, sizes = [], []
+    for labels in labelings:
+        _, inverse = np.unique(np.asarray(labels), return_inverse=True)
+        codes.append(inverse.astype(np.int32) + sum(sizes))
+        sizes.append(int(inverse.max()) + 1 if len(inverse) else 0)
+    offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+    return np.stack(codes, axis=1), sizes, offsets
+
+
+def _one_hot(codes, total, dtype=np.float32):
+    matrix = np.zeros((len(codes), total), dtype=dtype)
+    matrix[np.arange(len(codes))[:, None], codes] = 1
+    return matrix
+
+
+def _parallel(fn, starts, workers):
+    # Each worker gets an interleaved share of the blocks and returns one partial result,
+    # so memory does not grow with the number of blocks
+    shares = [starts[i::workers] for i in range(workers) if len(starts[i::workers])]
+    if len(shares) <= 1:
+        return [fn(share) for share in shares]
+    with ThreadPoolExecutor(max_workers=len(shares)) as pool:
+        return list(pool.map(fn, shares))
+
+
+def _single_threaded_blas(workers):
+    # Our threads already use every core; nested BLAS threads would only oversubscribe
+    if workers <= 1:
+        return nullcontext()
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return nullcontext()
+    return threadpool_limits(1)
+
+
+def _centroid_pass(embeddings, codes, total, sq_norms, block_rows, workers):
+    n, dim = embeddings.shape
+    
+    def run(starts):
+        sums = np.zeros((total, dim), dtype=np.float64)
+        for begin in starts:
+            end = min(begin + block_rows, n)
+            x = _rows(embeddings, begin, end)
+            sq_norms[begin:end] = np.einsum('ij,ij->i', x, x)
+            sums += _one_hot(codes[begin:end], total, np.float64).T @ x.astype(np.float64)
+        return sums
+    
+    sums = sum(_parallel(run, list(range(0, n, block_rows)), workers))
+    counts = np.bincount(codes.ravel(), minlength=total)
+    return sums, counts
+
+
+def _intra_pass(embeddings, codes, total, centroids, block_rows, workers):
+    n = len(embeddings)
+    
+    def run(starts):
+        dist = np.zeros(total, dtype=np.float64)
+        dist_sq = np.zeros(total, dtype=np.float64)
+        for begin in starts:
+            end = min(begin + block_rows, n)
+            x = _rows(embeddings, begin, end).astype(np.float64)
+            for column in codes[begin:end].T:
+                d_sq = ((x - centroids[column]) ** 2).sum(axis=1)
+                dist += np.bincount(column, weights=np.sqrt(d_sq), minlength=total)
+                dist_sq += np.bincount(column, weights=d_sq, minlength=total)
+        return dist, dist_sq
+    
+    partials = _parallel(run, list(range(0, n, block_rows)), workers)
+    return sum(p[0] for p in partials), sum(p[1] for p in partials)
+
+
+def _silhouette_pass(embeddings, codes, sizes, offsets, counts, sq_norms, rows, block_rows, block_cols, workers):
+    # Exact silhouette of the given rows against all n points
+    n = len(embeddings)
+    total = int(offsets[-1])
+    
+    def run(starts):
+        scores = np.zeros(len(sizes), dtype=np.float64)
+        for begin in starts:
+            idx = rows[begin:begin + block_rows]
+            x = np.ascontiguousarray(embeddings[idx], dtype=np.float32)
+            sums = np.zeros((len(idx), total), dtype=np.float64)
+            row_sq = sq_norms[idx][:, None]
+            
+            for col in range(0, n, block_cols):
+                col_end = min(col + block_cols, n)
+                d = row_sq + sq_norms[col:col_end][None, :] - 2 * (x @ _rows(embeddings, col, col_end).T)
+                np.sqrt(np.maximum(d, 0, out=d), out=d)
+                own = (idx >= col) & (idx < col_end)
+                d[np.flatnonzero(own), idx[own] - col] = 0
+                sums += d @ _one_hot(codes[col:col_end], total)
+            
+            for l, (size, offset) in enumerate(zip(sizes, offsets)):
+                if size < 2:
+                    continue
+                label = codes[idx, l] - offset
+                n_k = counts[offset:offset + size]
+                block = sums[:, offset:offset + size]
+                at = np.arange(len(idx))
+                a = block[at, label] / np.maximum(n_k[label] - 1, 1)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    mean = np.where(n_k > 0, block / n_k, np.inf)
+                mean[at, label] = np.inf
+                b = mean.min(axis=1)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    s = np.nan_to_num((b - a) / np.maximum(a, b))
+                # sklearn convention: 0 for points alone in their cluster
+                scores[l] += s[n_k[label] > 1].sum()
+        return scores
+    
+    return sum(_parallel(run, list(range(0, len(rows), block_rows)), workers))
+
+
+def _davies_bouldin(centroids, intra):
+    if len(centroids) < 2 or np.allclose(intra, 0):
+        return 0.0
+    distances = np.sqrt(((centroids[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2))
+    if np.allclose(distances, 0):
+        return 0.0
+    distances[distances == 0] = np.inf
+    return float(np.max((intra[:, None] + intra[None, :]) / distances, axis=1).mean())
+
+
+def _calinski_harabasz(centroids, counts, dist_sq, mean, n):
+    k = len(centroids)
+    extra = float((counts * ((centroids - mean) ** 2).sum(axis=1)).sum())
+    intra = float(dist_sq.sum())
+    return 1.0 if intra == 0 else extra * (n - k) / (intra * (k - 1))
+
+
+def evaluate(embeddings, labelings, silhouette=True, silhouette_sample=None, block_rows=BLOCK_ROWS,
+             block_cols=BLOCK_COLS, workers=None, seed=42):
+    # embeddings: n x d array or np.load(..., mmap_mode='r'); labelings: list of n label vectors.
+    # silhouette_sample scores that many random rows against all n points (None = every row, exact).
+    # Returns one dict per labeling: k, silhouette, davies_bouldin, calinski_harabasz.
+    workers = workers or os.cpu_count() or 1
+    n = len(embeddings)
+    codes, sizes, offsets = _encode(labelings)
+    total = int(offsets[-1])
+    sq_norms = np.empty(n, dtype=np.float32)
+    timings = {}
+    
+    with _single_threaded_blas(workers):
+        start = time.time()
+        sums, counts = _centroid_pass(embeddings, codes, total, sq_norms, block_rows, workers)
+        centroids = sums / np.maximum(counts, 1)[:, None]
+        mean = sums[offsets[0]:offsets[1]].sum(axis=0) / n
+        dist, dist_sq = _intra_pass(embeddings, codes, total, centroids, block_rows, workers)
+        timings['linear_seconds'] = round(time.time() - start, 2)
+        
+        silhouettes = None
+        if silhouette:
+            start = time.time()
+            if silhouette_sample is not None and silhouette_sample < n:
+                rows = np.sort(np.random.default_rng(seed).choice(n, silhouette_sample, replace=False))
+            else:
+                rows = np.arange(n)
+            silhouettes = _silhouette_pass(embeddings, codes, sizes, offsets, counts, sq_norms, rows,
+                                           block_rows, block_cols, workers) / len(rows)
+            timings['silhouette_seconds'] = round(time.time() - start, 2)
+            timings['silhouette_rows'] = len(rows)
+    
+    results = []
+    for l, (size, offset) in enumerate(zip(sizes, offsets)):
+        part = slice(offset, offset + size)
+        result = {'k': size, 'silhouette': None, 'davies_bouldin': None, 'calinski_harabasz': None}
+        if 2 <= size < n:
+            intra = dist[part] / np.maximum(counts[part], 1)
+            result.update(
+                silhouette=float(silhouettes[l]) if silhouettes is not None else None,
+                davies_bouldin=_davies_bouldin(centroids[part], intra),
+                calinski_harabasz=_calinski_harabasz(centroids[part], counts[part], dist_sq[part], mean, n)
+            )
+        results.append(result)
+    logger.info(f"Scored {len(labelings)} labelings of {n} rows: {timings}")
+    return results
+
+
+def fit_labels(embeddings, k, batch_size=5000, epochs=5, seed=42):
+    # Same MiniBatchKMeans loop as part2_modeling, one batch of the mmap in memory at a time
+    from sklearn.cluster import MiniBatchKMeans
+    
+    kmeans = MiniBatchKMeans(n_clusters=k, random_state=seed, batch_size=batch_size, n_init=10,
+                             max_iter=300, reassignment_ratio=0.01)
+    n = len(embeddings)
+    for _ in range(epochs):
+        for begin in range(0, n, batch_size):
+            kmeans.partial_fit(_rows(embeddings, begin, begin + batch_size))
+    
+    labels = np.empty(n, dtype=np.int32)
+    for begin in range(0, n, batch_size):
+        labels[begin:begin + batch_size] = kmeans.predict(_rows(embeddings, begin, begin + batch_size))
+    return labels
+
+
+def sweep(embeddings, ks, batch_size=5000, epochs=5, seed=42, **options):
+    # Fits one MiniBatchKMeans per K, then scores all of them in a single set of passes
+    labelings = []
+    for k in ks:
+        start = time.time()
+        labelings.append(fit_labels(embeddings, k, batch_size, epochs, seed))
+        logger.info(f"K={k}: fitted in {time.time() - start:.1f}s")
+    return evaluate(embeddings, labelings, seed=seed, **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster quality (silhouette, Davies-Bouldin, Calinski-Harabasz) "
+                                                 "over the full embedding matrix, for a range of K")
+    parser.add_argument('--embeddings', default=os.path.join('artifacts', 'sentence_embeddings_all_top10_100.npy'))
+    parser.add_argument('--labels', nargs='+', default=None,
+                        help=".npy label vectors to score instead of fitting MiniBatchKMeans")
+    parser.add_argument('--k-min', type=int, default=10)
+    parser.add_argument('--k-max', type=int, default=40)
+    parser.add_argument('--k-step', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--silhouette-sample', type=int, default=None,
+                        help="score this many random rows against all points (default: all rows, exact)")
+    parser.add_argument('--no-silhouette', action='store_true', help="only the linear-time metrics")
+    parser.add_argument('--block-rows', type=int, default=BLOCK_ROWS)
+    parser.add_argument('--block-cols', type=int, default=BLOCK_COLS)
+    parser.add_argument('--workers', type=int, default=None, help="default: number of cores")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help="write the results as JSON")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    embeddings = np.load(args.embeddings, mmap_mode='r')
+    logger.info(f"{args.embeddings}: {embeddings.shape}, {embeddings.dtype}")
+    options = dict(silhouette=not args.no_silhouette, silhouette_sample=args.silhouette_sample,
+                   block_rows=args.block_rows, block_cols=args.block_cols, workers=args.workers)
+    
+    start = time.time()
+    if args.labels:
+        results = evaluate(embeddings, [np.load(path) for path in args.labels], seed=args.seed, **options)
+        for path, result in zip(args.labels, results):
+            result['labels'] = path
+    else:
+        ks = range(args.k_min, args.k_max + 1, args.k_step)
+        results = sweep(embeddings, ks, args.batch_size, args.epochs, args.seed, **options)
+    
+    print(f"{'K':>4} {'Silhouette':>11} {'Davies-Bouldin':>15} {'Calinski-Harabasz':>18}")
+    for result in results:
+        sil = f"{result['silhouette']:.4f}" if result['silhouette'] is not None else '-'
+        db = f"{result['davies_bouldin']:.4f}" if result['davies_bouldin'] is not None else '-'
+        ch = f"{result['calinski_harabasz']:.2f}" if result['calinski_harabasz'] is not None else '-'
+        print(f"{result['k']:>4} {sil:>11} {db:>15} {ch:>18}")
+    print(f"Total time: {time.time() - start:.1f}s")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import os
+import re
+import json
+import time
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Append-only, memory-mapped store of sentence embeddings, one directory per encoder model:
+#   <root>/<model>/meta.json                     model name, dimension, dtype, chunk list
+#   <root>/<model>/chunk_00000.keys.npy          uint64 sentence hashes
+#   <root>/<model>/chunk_00000.npy               vectors (float32 / float16 / int8)
+#   <root>/<model>/chunk_00000.scale.npy         per-row scale, int8 only
+# The pipeline encodes only sentences whose hash is not in the store yet, so new reviews do not
+# trigger re-embedding of the whole corpus.
+
+DTYPES = ('float32', 'float16', 'int8')
+READ_BLOCK = 100000
+
+
+def sentence_keys(sentences):
+    return pd.util.hash_array(np.asarray([str(s) for s in sentences], dtype=object))
+
+
+def model_slug(model_name):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '__', model_name)
+
+
+class EmbeddingStore:
+    def __init__(self, root, model_name, dtype='float16'):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, got {dtype!r}")
+        self.path = os.path.join(root, model_slug(model_name))
+        self.model_name = model_name
+        self.dtype = dtype
+        self.dim = None
+        self.chunks = []
+        os.makedirs(self.path, exist_ok=True)
+        
+        meta_path = os.path.join(self.path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta['model'] != model_name:
+                raise ValueError(f"{self.path} holds embeddings of {meta['model']}, not {model_name}")
+            # An existing store keeps the dtype it was created with
+            self.dtype = meta['dtype']
+            self.dim = meta['dim']
+            self.chunks = meta['chunks']
+        self._load_index()
+    
+    def _load_index(self):
+        self._vectors = []
+        self._scales = []
+        keys = []
+        for name in self.chunks:
+            keys.append(np.load(os.path.join(self.path, f'{name}.keys.npy')))
+            self._vectors.append(np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r'))
+            scale_path = os.path.join(self.path, f'{name}.scale.npy')
+            self._scales.append(np.load(scale_path) if os.path.exists(scale_path) else None)
+        
+        sizes = [len(k) for k in keys]
+        self._offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+        all_keys = np.concatenate(keys) if keys else np.empty(0, dtype=np.uint64)
+        order = np.argsort(all_keys, kind='stable')
+        self._keys = all_keys[order]
+        self._rows = order.astype(np.int64)
+    
+    def __len__(self):
+        return len(self._keys)
+    
+    def contains(self, keys):
+        if not len(self._keys):
+            return np.zeros(len(keys), dtype=bool)
+        pos = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        return self._keys[pos] == keys
+    
+    def get(self, keys):
+        # float32 vectors for the given keys, in the given order; every key must be stored
+        keys = np.asarray(keys, dtype=np.uint64)
+        pos = np.searchsorted(self._keys, keys)
+        if len(keys) and (pos.max() >= len(self._keys) or (self._keys[pos] != keys).any()):
+            raise KeyError("Some sentences are not in the embedding store")
+        
+        rows = self._rows[pos]
+        chunk_ids = np.searchsorted(self._offsets, rows, side='right') - 1
+        out = np.empty((len(keys), self.dim), dtype=np.float32)
+        for chunk_id in np.unique(chunk_ids):
+            mask = chunk_ids == chunk_id
+            local = rows[mask] - self._offsets[chunk_id]
+            vectors = np.asarray(self._vectors[chunk_id][local], dtype=np.float32)
+            if self._scales[chunk_id] is not None:
+                vectors *= self._scales[chunk_id][local][:, None]
+            out[mask] = vectors
+        return out
+    
+    def add(self, keys, vectors):
+        # Writes one new chunk; files are renamed into place before meta.json lists them
+        keys = np.asarray(keys, dtype=np.uint64)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected dimension {self.dim}, got {vectors.shape[1]}")
+        
+        name = f'chunk_{len(self.chunks):05d}'
+        scale = None
+        if self.dtype == 'int8':
+            # Symmetric per-row quantization
+            scale = np.abs(vectors).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            stored = np.round(vectors / scale[:, None]).astype(np.int8)
+            scale = scale.astype(np.float32)
+        else:
+            stored = vectors.astype(self.dtype)
+        
+        self._save_array(f'{name}.keys.npy', keys)
+        self._save_array(f'{name}.npy', stored)
+        if scale is not None:
+            self._save_array(f'{name}.scale.npy', scale)
+        
+        self.chunks.append(name)
+        meta = {'model': self.model_name, 'dim': self.dim, 'dtype': self.dtype, 'chunks': self.chunks}
+        tmp_path = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, 'meta.json'))
+        self._load_index()
+    
+    def _save_array(self, filename, array):
+        tmp_path = os.path.join(self.path, f'{filename}.tmp.npy')
+        np.save(tmp_path, array)
+        os.replace(tmp_path, os.path.join(self.path, filename))
+
+
+def load_encoder(model_name, device=None, max_seq_length=128):
+    from sentence_transformers import SentenceTransformer
+    
+    model = SentenceTransformer(model_name, device=device)
+    if device == 'cuda':
+        model = model.half()
+    model.max_seq_length = max_seq_length
+    return model
+
+
+def embed_missing(sentences, encoder, store, batch_size=64, chunk_rows=50000):
+    # Encodes the sentences missing from the store. They are sorted by length so each
+    # encode batch holds similar lengths (less padding); every chunk is persisted as it finishes.
+    sentences = list(sentences)
+    keys = sentence_keys(sentences)
+    unique_keys, first = np.unique(keys, return_index=True)
+    missing = np.flatnonzero(~store.contains(unique_keys))
+    logger.info(f"Embeddings: {len(keys)} sentences, {len(unique_keys)} unique, "
+                f"{len(unique_keys) - len(missing)} stored, {len(missing)} to encode")
+    if not len(missing):
+        return 0
+    
+    texts = [str(sentences[i]) for i in first[missing]]
+    order = np.argsort([len(t) for t in texts], kind='stable')
+    start = time.time()
+    for begin in range(0, len(order), chunk_rows):
+        idx = order[begin:begin + chunk_rows]
+        vectors = encoder.encode([texts[i] for i in idx], batch_size=batch_size,
+                                 show_progress_bar=False, normalize_embeddings=True)
+        store.add(unique_keys[missing[idx]], vectors)
+        done = min(begin + chunk_rows, len(order))
+        logger.info(f"Encoded {done}/{len(order)} ({done / max(time.time() - start, 1e-9):.0f} sentences/s)")
+    return len(missing)
+
+
+def write_embeddings(sentences, store, out_path):
+    # Embedding matrix aligned with `sentences`, written block by block into a .npy file
+    keys = sentence_keys(sentences)
+    out = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32, shape=(len(keys), store.dim))
+    for begin in range(0, len(keys), READ_BLOCK):
+        out[begin:begin + READ_BLOCK] = store.get(keys[begin:begin + READ_BLOCK])
+    out.flush()
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed sentences through the content-addressed embedding store")
+    parser.add_argument('--sentences', default=os.path.join('artifacts', 'sentences_for_aspects_all_top10.csv'))
+    parser.add_argument('--column', default='sentence')
+    parser.add_argument('--model', default='intfloat/multilingual-e5-base')
+    parser.add_argument('--store', default=os.path.join('artifacts', 'embeddings'))
+    parser.add_argument('--dtype', default='float16', choices=DTYPES)
+    parser.add_argument('--device', default=None, help="e.g. cuda; default: sentence-transformers picks")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--output', default=os.path.join('artifacts', 'sentence_embeddings_all_top10.npy'))
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    sentences = pd.read_csv(args.sentences)[args.column].tolist()
+    store = EmbeddingStore(args.store, args.model, args.dtype)
+    if not store.contains(np.unique(sentence_keys(sentences))).all():
+        embed_missing(sentences, load_encoder(args.model, args.device), store, args.batch_size)
+    embeddings = write_embeddings(sentences, store, args.output)
+    print(f"Saved embeddings: {embeddings.shape} -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+import argparse
+import os
+import re
+import shutil
+import time
+import logging
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Streaming version of part2_preprocess_data: reads reviews in chunks, cleans them and detects
+# the language on a process pool, and writes every output in the same pass. Memory depends on
+# the chunk size and the number of workers, not on the size of the corpus.
+
+LANG_MODEL_URL = "https://dl.fbaipublicfiles.com/fasttext/supervised-models/lid.176.bin"
+COLUMNS = ["listing_id", "comments", "date"]
+
+_model = None
+
+
+def clean_text_basic(text):
+    text = str(text).lower()
+    text = re.sub(r"http\S+|www\.\S+", " ", text)  # linki
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+
+def clean_text_series(texts):
+    # Same rules as clean_text_basic, vectorized over a column
+    return (texts.astype(str).str.lower()
+            .str.replace(r"http\S+|www\.\S+", " ", regex=True)
+            .str.replace(r"\s+", " ", regex=True)
+            .str.strip())
+
+
+# Sentence segmentation of part2_modeling(_basic); also used by the microservice's online inference
+MIN_SENTENCE_CHARS = 10
+
+
+def simple_sentence_split(text: str):
+    parts = re.split(r'(?<=[.!?])\s+|\n+', str(text))
+    parts = [p.strip() for p in parts if p and p.strip()]
+    return parts
+
+
+def review_sentences(texts):
+    # clean, split, drop ultra short sentences
+    sentences = []
+    for text in texts:
+        sentences.extend(s for s in simple_sentence_split(clean_text_basic(text)) if len(s) >= MIN_SENTENCE_CHARS)
+    return sentences
+
+
+def load_lang_model(model_path):
+    import fasttext
+    
+    if not os.path.exists(model_path):
+        urllib.request.urlretrieve(LANG_MODEL_URL, model_path)
+        logger.info(f"Downloaded {model_path}")
+    fasttext.FastText.eprint = lambda x: None
+    return fasttext.load_model(model_path)
+
+
+def detect_lang_fasttext(texts, model, max_chars=600):
+    # One predict call for the whole batch; falls back to row by row if the batch fails
+    texts = [str(t)[:max_chars].replace('\n', ' ') for t in texts]
+    try:
+        labels, _ = model.predict(texts, k=1)
+        return [label[0].replace('__label__', '') if label else "unknown" for label in labels]
+    except Exception:
+        langs = []
+        for text in texts:
+            try:
+                langs.append(model.predict(text, k=1)[0][0].replace('__label__', ''))
+            except Exception:
+                langs.append("unknown")
+        return langs
+
+
+def _init_worker(model_path):
+    global _model
+    _model = load_lang_model(model_path)
+
+
+def process_chunk(chunk, min_chars=20):
+    df = chunk[COLUMNS].dropna(subset=["listing_id", "comments"])
+    df["listing_id"] = df["listing_id"].astype("int64", errors="ignore")
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    
+    df["len_chars"] = df["comments"].astype(str).str.len()
+    df = df[df["len_chars"] >= min_chars].copy()
+    
+    df["text_clean"] = clean_text_series(df["comments"])
+    df["lang"] = detect_lang_fasttext(df["text_clean"].tolist(), _model) if len(df) else []
+    
+    # Duplicates are dropped in the parent, which sees the chunks in order
+    keys = pd.util.hash_pandas_object(df[["listing_id", "comments"]].astype(str), index=False)
+    return df, keys.to_numpy()
+
+
+class SeenKeys:
+    # Hashes of (listing_id, comments) already written, kept as a sorted uint64
+    # array (8 bytes per review) instead of a set of Python ints
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.uint64)
+    
+    def first_seen(self, keys):
+        # Mask of rows whose key appears neither earlier in this chunk nor in a previous one
+        mask = ~pd.Series(keys).duplicated().to_numpy()
+        if len(self.keys):
+            pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            mask &= self.keys[pos] != keys
+        new = np.sort(keys[mask])
+        self.keys = np.insert(self.keys, np.searchsorted(self.keys, new), new)
+        return mask
+
+
+class ShardedWriter:
+    # Appends chunks to CSV files, writing the header only once per file
+    def __init__(self):
+        self.rows = {}
+    
+    def append(self, path, df):
+        if df.empty:
+            return
+        header = path not in self.rows
+        df.to_csv(path, mode='w' if header else 'a', header=header, index=False)
+        self.rows[path] = self.rows.get(path, 0) + len(df)
+
+
+def run(input_path, output_dir, model_path="lid.176.bin", chunk_size=50000, workers=None,
+        min_chars=20, top_langs=10):
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    shard_dir = os.path.join(output_dir, "_lang_shards")
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    os.makedirs(shard_dir)
+    
+    all_path = os.path.join(output_dir, "preprocessed_comments_all.csv")
+    eng_path = os.path.join(output_dir, "preprocessed_comments_all_eng.csv")
+    top_path = os.path.join(output_dir, "preprocessed_comments_all_top10.csv")
+    for path in (all_path, eng_path, top_path):
+        if os.path.exists(path):
+            os.remove(path)
+    
+    if not os.path.exists(model_path):
+        load_lang_model(model_path)
+    
+    writer = ShardedWriter()
+    seen = SeenKeys()
+    lang_counts = {}
+    start = time.time()
+    total_in = 0
+    
+    reader = pd.read_csv(input_path, usecols=COLUMNS, chunksize=chunk_size)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+        # At most 2 chunks per worker in flight keeps memory bounded; results are taken in input order
+        pending = []
+        for chunk in reader:
+            total_in += len(chunk)
+            pending.append(pool.submit(process_chunk, chunk, min_chars))
+            if len(pending) >= 2 * workers:
+                _write_result(pending.pop(0).result(), writer, seen, lang_counts, all_path, eng_path, shard_dir)
+        for future in pending:
+            _write_result(future.result(), writer, seen, lang_counts, all_path, eng_path, shard_dir)
+    
+    # Top languages are only known at the end: concatenate their shards
+    top = sorted(lang_counts, key=lambda lang: -lang_counts[lang])[:top_langs]
+    logger.info(f"Keeping top {top_langs} languages: {top}")
+    with open(top_path, 'w', encoding='utf-8', newline='') as out:
+        for i, lang in enumerate(top):
+            with open(os.path.join(shard_dir, f"{lang}.csv"), encoding='utf-8', newline='') as shard:
+                header = shard.readline()
+                if i == 0:
+                    out.write(header)
+                shutil.copyfileobj(shard, out)
+    shutil.rmtree(shard_dir)
+    
+    elapsed = time.time() - start
+    kept = writer.rows.get(all_path, 0)
+    logger.info(f"{total_in} reviews -> {kept} kept ({elapsed:.1f}s, {total_in / max(elapsed, 1e-9):.0f} reviews/s)")
+    logger.info(f"Saved {all_path}: {kept}, {eng_path}: {writer.rows.get(eng_path, 0)}, "
+                f"{top_path}: {sum(lang_counts[lang] for lang in top)}")
+    return lang_counts
+
+
+def _write_result(result, writer, seen, lang_counts, all_path, eng_path, shard_dir):
+    df, keys = result
+    df = df[seen.first_seen(keys)]
+    
+    writer.append(all_path, df)
+    writer.append(eng_path, df[df["lang"] == "en"])
+    for lang, part in df.groupby("lang", sort=False):
+        writer.append(os.path.join(shard_dir, f"{lang}.csv"), part)
+        lang_counts[lang] = lang_counts.get(lang, 0) + len(part)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean reviews and detect language (streaming, multi-process)")
+    parser.add_argument('--input', default=os.path.join('data2', 'reviews.csv', 'reviews.csv'))
+    parser.add_argument('--output-dir', default='artifacts')
+    parser.add_argument('--lang-model', default='lid.176.bin')
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--workers', type=int, default=None, help="default: number of cores")
+    parser.add_argument('--min-chars', type=int, default=20)
+    parser.add_argument('--top-langs', type=int, default=10)
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    lang_counts = run(args.input, args.output_dir, args.lang_model, args.chunk_size, args.workers,
+                      args.min_chars, args.top_langs)
+    print("Top 15 detected languages:")
+    for lang, count in sorted(lang_counts.items(), key=lambda item: -item[1])[:15]:
+        print(f"  {lang:>8} {count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Sentence-level VADER sentiment for the baseline model. Review text is very repetitive, so
+# sentences are deduplicated first and only unique ones are scored, on a process pool. Compound
+# scores are kept in a cache keyed by a 64-bit hash of the sentence; re-runs and new data only
+# score sentences that were never seen before.
+
+DEFAULT_CACHE = os.path.join("artifacts", "cache", "sentiment_vader.npz")
+
+_analyzer = None
+
+
+def labels_from_compound(scores):
+    scores = np.asarray(scores)
+    return np.where(scores >= 0.05, "positive", np.where(scores <= -0.05, "negative", "neutral"))
+
+
+def normalize_sentences(sentences):
+    # VADER splits on whitespace, so collapsing it does not change the score.
+    # Case and punctuation are left alone: VADER reads both as emphasis.
+    return pd.Series(sentences, dtype=object).astype(str).str.strip().str.replace(r"\s+", " ", regex=True)
+
+
+def sentence_hashes(sentences):
+    return pd.util.hash_array(np.asarray(sentences, dtype=object))
+
+
+def _init_worker():
+    global _analyzer
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+    _analyzer = SentimentIntensityAnalyzer()
+
+
+def _score_chunk(sentences):
+    return np.array([_analyzer.polarity_scores(s)["compound"] for s in sentences], dtype=np.float32)
+
+
+class SentimentCache:
+    # hash -> compound score, two sorted arrays in one .npz file
+    def __init__(self, path=DEFAULT_CACHE):
+        self.path = path
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.scores = np.empty(0, dtype=np.float32)
+        if path and os.path.exists(path):
+            with np.load(path) as data:
+                self.keys = data["keys"]
+                self.scores = data["scores"]
+            logger.info(f"Loaded sentiment cache {path}: {len(self.keys)} sentences")
+    
+    def __len__(self):
+        return len(self.keys)
+    
+    def lookup(self, keys):
+        # Returns (found mask, scores); scores are undefined where not found
+        if not len(self.keys):
+            return np.zeros(len(keys), dtype=bool), np.zeros(len(keys), dtype=np.float32)
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return self.keys[pos] == keys, self.scores[pos]
+    
+    def add(self, keys, scores):
+        order = np.argsort(keys)
+        keys, scores = keys[order], scores[order]
+        at = np.searchsorted(self.keys, keys)
+        self.keys = np.insert(self.keys, at, keys)
+        self.scores = np.insert(self.scores, at, scores)
+    
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(tmp_path, keys=self.keys, scores=self.scores)
+        os.replace(tmp_path, self.path)
+
+
+def score_sentences(sentences, cache_path=DEFAULT_CACHE, workers=None, chunk_size=20000):
+    # Returns compound scores aligned with `sentences`
+    start = time.time()
+    sentences = list(sentences)
+    keys = sentence_hashes(normalize_sentences(sentences))
+    unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    
+    cache = SentimentCache(cache_path)
+    found, unique_scores = cache.lookup(unique_keys)
+    missing = np.flatnonzero(~found)
+    
+    if len(missing):
+        texts = normalize_sentences([sentences[i] for i in first[missing]]).tolist()
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            new_scores = np.concatenate(list(pool.map(_score_chunk, chunks)))
+        unique_scores = unique_scores.copy()
+        unique_scores[missing] = new_scores
+        
+        cache.add(unique_keys[missing], new_scores)
+        if cache_path:
+            cache.save()
+    
+    logger.info(f"Sentiment: {len(keys)} sentences, {len(unique_keys)} unique, {len(missing)} scored, "
+                f"{len(unique_keys) - len(missing)} from cache ({time.time() - start:.1f}s)")
+    return unique_scores[inverse]
+
+
+def vader_labels(sentences, **kwargs):
+    return labels_from_compound(score_sentences(sentences, **kwargs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add a VADER sentiment column to a sentences CSV")
+    parser.add_argument('--input', default=os.path.join('artifacts', 'BASE_sentences_for_aspects_labeled_eng.csv'))
+    parser.add_argument('--output', default=os.path.join('artifacts', 'BASE_sentences_for_aspects_eng_WITH_ASPECTS.csv'))
+    parser.add_argument('--column', default='sentence')
+    parser.add_argument('--cache', default=DEFAULT_CACHE, help="'' disables the cache")
+    parser.add_argument('--workers', type=int, default=None, help="default: number of cores")
+    parser.add_argument('--chunk-size', type=int, default=20000)
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    df = pd.read_csv(args.input)
+    df["sentiment"] = vader_labels(df[args.column].tolist(), cache_path=args.cache or None,
+                                   workers=args.workers, chunk_size=args.chunk_size)
+    print("Sentiment distribution:")
+    print(df["sentiment"].value_counts(normalize=True))
+    df.to_csv(args.output, index=False)
+    print(f"Saved {args.output}: {df.shape}")
+
+
+if __name__ == '__main__':
+    main()